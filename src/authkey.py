@@ -0,0 +1,36 @@
+import os
+import secrets
+
+# Only the standard library is imported here, main.py builds its serve parser from this
+# module without loading VTK.
+AUTHKEY_ENV = 'DICOM_RENDER_AUTHKEY'
+DEFAULT_KEY_FILE = os.path.join(os.path.expanduser('~'), '.dicom-render-server.key')
+
+
+def resolve_authkey(authkey=None, key_file=DEFAULT_KEY_FILE, create=False):
+    # Requests are pickled, so the key is what stands between other local users and code
+    # execution as the server's user. Explicit key, then $DICOM_RENDER_AUTHKEY, then the key
+    # file; the server creates a random key file readable only by its user.
+    if authkey:
+        return authkey.encode() if isinstance(authkey, str) else authkey
+    if os.environ.get(AUTHKEY_ENV):
+        return os.environ[AUTHKEY_ENV].encode()
+    if create:
+        authkey = secrets.token_hex(32).encode()
+        descriptor = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(authkey)
+        # O_CREAT's mode does not apply to an existing file
+        os.chmod(key_file, 0o600)
+        return authkey
+    if not os.path.isfile(key_file):
+        raise ValueError(f"No authkey given, ${AUTHKEY_ENV} is unset and {key_file} does not exist")
+    with open(key_file, 'rb') as file:
+        return file.read().strip()
+
+
+def add_authkey_arguments(parser):
+    parser.add_argument('--authkey', default=None,
+                        help=f'shared secret, defaults to ${AUTHKEY_ENV} or a random key written to --key-file')
+    parser.add_argument('--key-file', default=DEFAULT_KEY_FILE,
+                        help='key file readable only by this user, read by RenderClient')
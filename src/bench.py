@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+MAIN_PATH = os.path.join(SRC_DIR, 'main.py')
+TEST_DICOM_FOLDER = os.path.join(ROOT_DIR, 'test', 'data', 'Ankle')
+
+# What the baseline main.py imported before parsing its arguments. The modules are listed
+# instead of importing src.export.nerf, which now also loads cv2, COLMAP and pipeline code
+# the baseline never did.
+EAGER_IMPORTS = '; '.join([
+    'import numpy',
+    'import vtk',
+    'import vtkmodules.vtkInteractionStyle',
+    'import vtkmodules.vtkRenderingOpenGL2',
+    'import vtkmodules.vtkRenderingVolumeOpenGL2',
+    'import vtkmodules.vtkCommonColor',
+    'import vtkmodules.vtkCommonDataModel',
+    'import vtkmodules.vtkIOImage',
+    'import vtkmodules.vtkRenderingCore',
+    'import vtkmodules.vtkRenderingVolume',
+    'import src.model.colormap.Standard',
+    'import src.model.colormap.toRGBPoints',
+])
+
+
+def time_command(command, repeat):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT_DIR, SRC_DIR, env.get('PYTHONPATH', '')])
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[0], timings[len(timings) // 2]
+
+
+def print_results(results):
+    print(f"{'case':<32} {'best [s]':>10} {'median [s]':>11}")
+    for name, (best, median) in results:
+        print(f"{name:<32} {best:10.3f} {median:11.3f}")
+
+
+def bench_startup(repeat):
+    # Wall time of a fresh interpreter for --help, with the eager imports and with the lazy CLI
+    results = [
+        ('python (empty)', time_command([sys.executable, '-c', 'pass'], repeat)),
+        ('eager imports', time_command([sys.executable, '-c', EAGER_IMPORTS], repeat)),
+        ('main.py --help', time_command([sys.executable, MAIN_PATH, '--help'], repeat)),
+        ('main.py export --help', time_command([sys.executable, MAIN_PATH, 'export', '--help'], repeat)),
+    ]
+    print_results(results)
+    eager = results[1][1][1]
+    lazy = results[2][1][1]
+    print(f"--help startup: {eager / lazy:.1f}x faster ({eager - lazy:.3f}s saved)")
+    return results
+
+
+def time_call(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[0], timings[len(timings) // 2]
+
+
+def bench_projection(dicom_folder, frames, size, repeat):
+    # Frames per second of each blend mode in the VTK pipeline over an orbit of the volume,
+    # then the numpy projections over the same voxels
+    from src.pipeline import build_pipeline
+    from src.projection import MODES, PROJECTION_MODES, volume_from_image, project_axis, project_oblique
+
+    pipeline = build_pipeline(dicom_folder or TEST_DICOM_FOLDER, size=size, offscreen=True)
+    render_window = pipeline.render_window
+
+    def orbit():
+        for _ in range(frames):
+            pipeline.camera.Azimuth(360.0 / frames)
+            render_window.Render()
+
+    print(f"{'case':<32} {'best [s]':>10} {'median [s]':>11} {'fps':>8}")
+    composite_fps = None
+    for mode in MODES:
+        pipeline.set_projection_mode(mode)
+        render_window.Render()  # shader rebuild for the new blend mode is not part of the timing
+        best, median = time_call(orbit, repeat)
+        fps = frames / median
+        composite_fps = composite_fps or fps
+        print(f"{'vtk ' + mode:<32} {best:10.3f} {median:11.3f} {fps:8.1f}  ({fps / composite_fps:.1f}x composite)")
+
+    volume, spacing = volume_from_image(pipeline.image_data)
+    for mode in PROJECTION_MODES:
+        best, median = time_call(lambda: project_axis(volume, mode, axis=1), repeat)
+        print(f"{'numpy axis ' + mode:<32} {best:10.3f} {median:11.3f} {1 / median:8.1f}")
+        best, median = time_call(lambda: project_oblique(volume, mode, (1, 1, 0), spacing=spacing), repeat)
+        print(f"{'numpy oblique ' + mode:<32} {best:10.3f} {median:11.3f} {1 / median:8.1f}")
+    pipeline.release()
+
+
+def _filter_capture(render_window):
+    # Capture as it was before FrameCapture: a new vtkWindowToImageFilter and output per frame
+    from vtkmodules.vtkRenderingCore import vtkWindowToImageFilter
+    from vtkmodules.util.numpy_support import vtk_to_numpy
+    render_window.Render()
+    w2if = vtkWindowToImageFilter()
+    w2if.SetInput(render_window)
+    w2if.SetInputBufferTypeToRGBA()
+    w2if.Update()
+    image = w2if.GetOutput()
+    w, h, _ = image.GetDimensions()
+    return vtk_to_numpy(image.GetPointData().GetScalars()).reshape(h, w, 4)[::-1]
+
+
+def bench_capture(dicom_folder, frames, size, repeat):
+    # Per frame cost of getting pixels out of the render window over an orbit of the volume:
+    # the PNG export path, a filter per frame, the reused FrameCapture view and a batch into
+    # one preallocated (N, H, W, 4) array. Render time alone is subtracted for the overhead.
+    import tempfile
+    import numpy as np
+    from src.pipeline import build_pipeline
+    from src.export.nerf import FrameCapture, write_image
+
+    pipeline = build_pipeline(dicom_folder or TEST_DICOM_FOLDER, size=size, offscreen=True)
+    render_window = pipeline.render_window
+    camera = pipeline.camera
+    capture = FrameCapture(render_window)
+    batch = np.empty((frames,) + capture.shape, dtype=np.uint8)
+    step = 360.0 / frames
+    output_dir = tempfile.mkdtemp()
+
+    def orbit(grab):
+        def run():
+            for idx in range(frames):
+                camera.Azimuth(step)
+                grab(idx)
+        return run
+
+    cases = [
+        ('render only', orbit(lambda idx: render_window.Render())),
+        ('write_image png', orbit(lambda idx: write_image(render_window, os.path.join(output_dir, f'r_{idx}.png')))),
+        ('filter per frame', orbit(lambda idx: _filter_capture(render_window))),
+        ('FrameCapture view', orbit(lambda idx: capture.capture())),
+        ('FrameCapture batch', lambda: capture.capture_batch(range(frames), lambda idx: camera.Azimuth(step), batch)),
+    ]
+    render_window.Render()
+    print(f"{'case':<32} {'best [s]':>10} {'median [s]':>11} {'ms/frame':>9} {'capture ms':>11}")
+    render_ms = None
+    for name, function in cases:
+        best, median = time_call(function, repeat)
+        per_frame = median / frames * 1e3
+        render_ms = per_frame if render_ms is None else render_ms
+        print(f"{name:<32} {best:10.3f} {median:11.3f} {per_frame:9.2f} {per_frame - render_ms:11.2f}")
+    shutil.rmtree(output_dir)
+    pipeline.release()
+
+
+def run_benchmark(args):
+    if args.target == 'startup':
+        return bench_startup(args.repeat)
+    if args.target == 'projection':
+        return bench_projection(args.dicom_folder, args.frames, args.size, args.repeat)
+    if args.target == 'capture':
+        return bench_capture(args.dicom_folder, args.frames, args.size, args.repeat)
+    raise ValueError(f"Unknown benchmark: {args.target}")
@@ -20,6 +20,9 @@ import cv2
 import os
 import shutil
 
+sys.path.append(str(Path(__file__).resolve().parents[1])) # make src importable when run as a script
+from src.model.pose_table import PoseTable, pose_table_path
+
 def parse_args():
 	parser = argparse.ArgumentParser(description="convert a text colmap export to nerf format transforms.json; optionally convert video to images, and optionally run colmap in the first place")
 
@@ -34,6 +37,7 @@ def parse_args():
 	parser.add_argument("--aabb_scale", default=16, choices=["1","2","4","8","16"], help="large scene scale factor. 1=scene fits in unit cube; power of 2 up to 16")
 	parser.add_argument("--skip_early", default=0, help="skip this many images from the start")
 	parser.add_argument("--out", default="transforms.json", help="output path")
+	parser.add_argument("--out_table", default="", help="output path of the binary pose table, defaults to --out with a .npz extension")
 	args = parser.parse_args()
 	return args
 
@@ -145,6 +149,20 @@ def closest_point_2_lines(oa, da, ob, db): # returns point closest to both rays
 		tb = 0
 	return (oa+ta*da+ob+tb*db) * 0.5, denom
 
+def closest_point_all_lines(origins, directions): # weighted average of closest_point_2_lines over every pair of rays, vectorized over the (N,N) pairs
+	d = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+	da, db = d[:,None,:], d[None,:,:]
+	c = np.cross(da, db)
+	denom = np.sum(c**2, axis=2)
+	t = origins[None,:,:] - origins[:,None,:]
+	ta = np.sum(t * np.cross(db, c), axis=2) / (denom + 1e-10) # det([t, db, c])
+	tb = np.sum(t * np.cross(da, c), axis=2) / (denom + 1e-10) # det([t, da, c])
+	ta = np.minimum(ta, 0)
+	tb = np.minimum(tb, 0)
+	p = (origins[:,None,:] + ta[...,None]*da + origins[None,:,:] + tb[...,None]*db) * 0.5
+	w = np.where(denom > 0.01, denom, 0.0)
+	return np.sum(p * w[...,None], axis=(0,1)) / np.sum(w)
+
 if __name__ == "__main__":
 	args = parse_args()
 	if args.video_in != "":
@@ -213,7 +231,7 @@ if __name__ == "__main__":
 	with open(os.path.join(TEXT_FOLDER,"images.txt"), "r") as f:
 		i = 0
 		bottom = np.array([0.0, 0.0, 0.0, 1.0]).reshape([1, 4])
-		out = {
+		meta = {
 			"camera_angle_x": angle_x,
 			"camera_angle_y": angle_y,
 			"fl_x": fl_x,
@@ -227,10 +245,11 @@ if __name__ == "__main__":
 			"w": w,
 			"h": h,
 			"aabb_scale": AABB_SCALE,
-			"frames": [],
 		}
+		names = []
+		sharpnesses = []
+		c2ws = []
 
-		up = np.zeros(3)
 		for line in f:
 			line = line.strip()
 			if line[0] == "#":
@@ -258,49 +277,35 @@ if __name__ == "__main__":
 				c2w = c2w[[1,0,2,3],:] # swap y and z
 				c2w[2,:] *= -1 # flip whole world upside down
 
-				up += c2w[0:3,1]
+				names.append(name)
+				sharpnesses.append(b)
+				c2ws.append(c2w)
 
-				frame={"file_path":name,"sharpness":b,"transform_matrix": c2w}
-				out["frames"].append(frame)
-	nframes = len(out["frames"])
+	# all poses as one (N,4,4) array, the steps below work on the whole stack at once
+	c2ws = np.array(c2ws)
+	nframes = c2ws.shape[0]
+	up = c2ws[:,0:3,1].sum(axis=0)
 	up = up / np.linalg.norm(up)
 	print("up vector was", up)
 	R = rotmat(up,[0,0,1]) # rotate up vector to [0,0,1]
 	R = np.pad(R,[0,1], mode="constant")
 	R[-1, -1] = 1
 
-
-	for f in out["frames"]:
-		f["transform_matrix"] = np.matmul(R, f["transform_matrix"]) # rotate up to be the z axis
+	c2ws = np.matmul(R, c2ws) # rotate up to be the z axis
 
 	# find a central point they are all looking at
 	print("computing center of attention...")
-	totw = 0.0
-	totp = np.array([0.0, 0.0, 0.0])
-	for f in out["frames"]:
-		mf = f["transform_matrix"][0:3,:]
-		for g in out["frames"]:
-			mg = g["transform_matrix"][0:3,:]
-			p, w = closest_point_2_lines(mf[:,3], mf[:,2], mg[:,3], mg[:,2])
-			if w > 0.01:
-				totp += p*w
-				totw += w
-	totp /= totw
+	totp = closest_point_all_lines(c2ws[:,0:3,3], c2ws[:,0:3,2])
 	print(totp) # the cameras are looking at totp
-	for f in out["frames"]:
-		f["transform_matrix"][0:3,3] -= totp
+	c2ws[:,0:3,3] -= totp
 
-	avglen = 0.
-	for f in out["frames"]:
-		avglen += np.linalg.norm(f["transform_matrix"][0:3,3])
-	avglen /= nframes
+	avglen = np.linalg.norm(c2ws[:,0:3,3], axis=1).mean()
 	print("avg camera distance from origin", avglen)
-	for f in out["frames"]:
-		f["transform_matrix"][0:3,3] *= 4.0 / avglen # scale to "nerf sized"
+	c2ws[:,0:3,3] *= 4.0 / avglen # scale to "nerf sized"
 
-	for f in out["frames"]:
-		f["transform_matrix"] = f["transform_matrix"].tolist()
+	table = PoseTable(c2ws, names, "train", {"sharpness": sharpnesses}, meta)
 	print(nframes,"frames")
-	print(f"writing {OUT_PATH}")
-	with open(OUT_PATH, "w") as outfile:
-		json.dump(out, outfile, indent=2)
\ No newline at end of file
+	table_path = args.out_table or pose_table_path(OUT_PATH)
+	print(f"writing {OUT_PATH} and {table_path}")
+	table.save(table_path)
+	table.write_json(OUT_PATH)
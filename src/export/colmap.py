@@ -0,0 +1,228 @@
+import os
+import sys
+import time
+import shutil
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+COLMAP_PATH = os.path.normpath('../COLMAP/COLMAP.bat')
+COLMAP_EXECUTABLE_ENV = 'COLMAP_EXECUTABLE'
+DEFAULT_TIMEOUT = 60 * 60
+DEFAULT_MAX_WORKERS = 2
+MODE_KNOWN_POSES = 'known_poses'
+MODE_AUTOMATIC = 'automatic'
+ERROR_TAIL_LINES = 20
+
+# OpenGL camera (VTK) looks down -z with y up, COLMAP looks down +z with y down
+VTK_TO_COLMAP = np.diag([1.0, -1.0, -1.0, 1.0])
+
+
+class ColmapError(Exception):
+    def __init__(self, step, command, message, returncode=None, output=''):
+        super().__init__(f"{step} failed: {message}")
+        self.step = step
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+
+
+class ColmapJob(object):
+    # One dataset to reconstruct. With view_matrices (N,4,4 VTK model-view matrices, in the
+    # order of image_names) and intrinsics (w, h, fx, fy, cx, cy) the job runs in known poses
+    # mode, otherwise the full automatic_reconstructor is used.
+    def __init__(self, name, image_path, workspace_path, image_names=None, view_matrices=None,
+                 intrinsics=None, matcher='exhaustive'):
+        self.name = name
+        self.image_path = image_path
+        self.workspace_path = workspace_path
+        self.image_names = image_names
+        self.view_matrices = view_matrices
+        self.intrinsics = intrinsics
+        self.matcher = matcher
+
+    @property
+    def mode(self):
+        return MODE_AUTOMATIC if self.view_matrices is None else MODE_KNOWN_POSES
+
+    @property
+    def text_path(self):
+        return os.path.join(self.workspace_path, 'text')
+
+
+class ColmapResult(object):
+    def __init__(self, job, error=None, elapsed=0.0, step_times=None):
+        self.job = job
+        self.error = error
+        self.elapsed = elapsed
+        self.step_times = step_times or {}
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'failed ({self.error})'
+        return f"ColmapResult({self.job.name}, {self.job.mode}, {status}, {self.elapsed:.1f}s)"
+
+
+def get_colmap_executable(executable=None):
+    # Explicit argument, then $COLMAP_EXECUTABLE, then the bundled COLMAP.bat
+    executable = executable or os.environ.get(COLMAP_EXECUTABLE_ENV) or COLMAP_PATH
+    if isinstance(executable, str):
+        return [executable]
+    return list(executable)
+
+
+def run_command(step, command, timeout=DEFAULT_TIMEOUT, cwd=None):
+    print(f"==== running: {' '.join(command)}")
+    try:
+        process = subprocess.run(command, cwd=cwd, timeout=timeout, stdout=subprocess.PIPE,
+                                 stderr=subprocess.STDOUT, text=True)
+    except subprocess.TimeoutExpired as e:
+        raise ColmapError(step, command, f"timed out after {timeout}s", output=_tail(e.output))
+    except OSError as e:
+        raise ColmapError(step, command, str(e))
+    if process.returncode != 0:
+        raise ColmapError(step, command, f"exit code {process.returncode}", process.returncode,
+                          _tail(process.stdout))
+    return process.stdout
+
+
+def _tail(output):
+    if not output:
+        return ''
+    if isinstance(output, bytes):
+        output = output.decode(errors='replace')
+    return '\n'.join(output.splitlines()[-ERROR_TAIL_LINES:])
+
+
+def rotmat2qvec(R):
+    # Inverse of colmap2nerf.qvec2rotmat, returns (qw, qx, qy, qz)
+    Rxx, Ryx, Rzx, Rxy, Ryy, Rzy, Rxz, Ryz, Rzz = R.flat
+    K = np.array([
+        [Rxx - Ryy - Rzz, 0, 0, 0],
+        [Ryx + Rxy, Ryy - Rxx - Rzz, 0, 0],
+        [Rzx + Rxz, Rzy + Ryz, Rzz - Rxx - Ryy, 0],
+        [Ryz - Rzy, Rzx - Rxz, Rxy - Ryx, Rxx + Ryy + Rzz]]) / 3.0
+    eigvals, eigvecs = np.linalg.eigh(K)
+    qvec = eigvecs[[3, 0, 1, 2], np.argmax(eigvals)]
+    if qvec[0] < 0:
+        qvec *= -1
+    return qvec
+
+
+def write_known_model(model_path, image_names, view_matrices, intrinsics):
+    # Text model with the exact VTK cameras and no points, input of point_triangulator.
+    # feature_extractor numbers images in file name order, the image ids here must match.
+    os.makedirs(model_path, exist_ok=True)
+    w, h, fx, fy, cx, cy = intrinsics
+    with open(os.path.join(model_path, 'cameras.txt'), 'w') as outfile:
+        outfile.write(f"1 PINHOLE {int(w)} {int(h)} {fx} {fy} {cx} {cy}\n")
+    order = np.argsort(image_names, kind='stable')
+    with open(os.path.join(model_path, 'images.txt'), 'w') as outfile:
+        for image_id, idx in enumerate(order, start=1):
+            w2c = VTK_TO_COLMAP @ np.asarray(view_matrices[idx], dtype=np.float64)
+            qvec = rotmat2qvec(w2c[0:3, 0:3])
+            tvec = w2c[0:3, 3]
+            values = ' '.join(str(v) for v in list(qvec) + list(tvec))
+            outfile.write(f"{image_id} {values} 1 {image_names[idx]}\n\n")
+    open(os.path.join(model_path, 'points3D.txt'), 'w').close()
+
+
+def intrinsics_from_camera(camera, render_window):
+    # VTK's view angle is the vertical field of view
+    w, h = render_window.GetSize()
+    fy = (h / 2) / np.tan(np.radians(camera.GetViewAngle()) / 2)
+    return w, h, fy, fy, w / 2, h / 2
+
+
+class ColmapRunner(object):
+    def __init__(self, executable=None, timeout=DEFAULT_TIMEOUT):
+        self.executable = get_colmap_executable(executable)
+        self.timeout = timeout
+
+    def run(self, step, **options):
+        command = self.executable + [step]
+        for key, value in options.items():
+            command += [f"--{key}", str(value)]
+        start = time.perf_counter()
+        run_command(step, command, self.timeout)
+        return time.perf_counter() - start
+
+    def reconstruct(self, job):
+        start = time.perf_counter()
+        step_times = {}
+        try:
+            if os.path.isdir(job.workspace_path):
+                shutil.rmtree(job.workspace_path)
+            os.makedirs(job.text_path)
+            if job.mode == MODE_KNOWN_POSES:
+                sparse_path = self._triangulate_known_poses(job, step_times)
+            else:
+                sparse_path = self._automatic_reconstruct(job, step_times)
+            step_times['model_converter'] = self.run('model_converter', input_path=sparse_path,
+                                                     output_path=job.text_path, output_type='TXT')
+        except ColmapError as e:
+            return ColmapResult(job, e, time.perf_counter() - start, step_times)
+        return ColmapResult(job, None, time.perf_counter() - start, step_times)
+
+    def _triangulate_known_poses(self, job, step_times):
+        # Poses are exact, so only features are matched and triangulated: no mapper, no bundle adjustment
+        database_path = os.path.join(job.workspace_path, 'database.db')
+        known_path = os.path.join(job.workspace_path, 'known')
+        sparse_path = os.path.join(job.workspace_path, 'sparse')
+        os.makedirs(sparse_path)
+        write_known_model(known_path, job.image_names, job.view_matrices, job.intrinsics)
+        w, h, fx, fy, cx, cy = job.intrinsics
+        step_times['feature_extractor'] = self.run(
+            'feature_extractor',
+            database_path=database_path,
+            image_path=job.image_path,
+            **{'ImageReader.camera_model': 'PINHOLE',
+               'ImageReader.single_camera': 1,
+               'ImageReader.camera_params': f"{fx},{fy},{cx},{cy}"})
+        step_times[f'{job.matcher}_matcher'] = self.run(f'{job.matcher}_matcher', database_path=database_path)
+        step_times['point_triangulator'] = self.run('point_triangulator',
+                                                    database_path=database_path,
+                                                    image_path=job.image_path,
+                                                    input_path=known_path,
+                                                    output_path=sparse_path)
+        return sparse_path
+
+    def _automatic_reconstruct(self, job, step_times):
+        step_times['automatic_reconstructor'] = self.run('automatic_reconstructor',
+                                                         dense=0,
+                                                         single_camera=0,
+                                                         workspace_path=job.workspace_path,
+                                                         image_path=job.image_path)
+        sparse_path = os.path.join(job.workspace_path, 'sparse', '0')
+        if not os.path.isdir(sparse_path):
+            raise ColmapError('automatic_reconstructor', None, "no COLMAP convergence")
+        return sparse_path
+
+
+def run_colmap_jobs(jobs, runner=None, max_workers=DEFAULT_MAX_WORKERS):
+    # Datasets are independent, so they are reconstructed concurrently; COLMAP does the heavy
+    # lifting in its own processes so threads are enough here
+    runner = runner or ColmapRunner()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs) or 1))) as executor:
+        results = list(executor.map(runner.reconstruct, jobs))
+    for result in results:
+        print(result)
+        if not result.ok:
+            print(f"Error: COLMAP {result.error.step} failed for {result.job.name}: {result.error}")
+            if result.error.output:
+                print(result.error.output)
+    return results
+
+
+def run_colmap2nerf(colmap2nerf_path, text_path, image_path, json_path, table_path,
+                    aabb_scale=1, timeout=DEFAULT_TIMEOUT):
+    run_command('colmap2nerf', [sys.executable, colmap2nerf_path,
+                                '--text', text_path,
+                                '--aabb_scale', str(aabb_scale),
+                                '--images', image_path,
+                                '--out', json_path,
+                                '--out_table', table_path], timeout)
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+
+
+SCALE_FOLDER = 'scale_{}'
+# Intrinsics in transforms_*.json that are measured in pixels, the camera angles are scale free
+PIXEL_INTRINSICS = ['fl_x', 'fl_y', 'cx', 'cy', 'w', 'h']
+
+
+def _area_downsample(image, factor):
+    # Mean over factor x factor blocks, trailing rows/columns that do not fill a block are dropped
+    h = image.shape[0] // factor
+    w = image.shape[1] // factor
+    image = image[:h * factor, :w * factor]
+    return image.reshape(h, factor, w, factor, image.shape[2]).mean(axis=(1, 3))
+
+
+def _to_rgba(premultiplied):
+    # Back from premultiplied float to straight uint8 RGBA
+    alpha = premultiplied[..., 3:4]
+    rgb = np.divide(premultiplied[..., :3], alpha, out=np.zeros_like(premultiplied[..., :3]), where=alpha > 0)
+    return np.clip(np.concatenate([rgb, alpha], axis=2) * 255.0 + 0.5, 0, 255).astype(np.uint8)
+
+
+def build_pyramid(rgba, factors):
+    # Area-averaged copies of an RGBA frame, one per downsampling factor.
+    # Colors are averaged premultiplied by alpha so transparent background pixels
+    # do not bleed into the edges of the volume. Each level is computed from the
+    # previous one when the factors divide, so 1/2/4 only reads the full frame once.
+    premultiplied = rgba.astype(np.float32) / 255.0
+    premultiplied[..., :3] *= premultiplied[..., 3:4]
+    levels = {}
+    current_factor = 1
+    current = premultiplied
+    for factor in sorted(factors):
+        if factor == 1:
+            levels[factor] = rgba
+            continue
+        if factor % current_factor == 0:
+            current = _area_downsample(current, factor // current_factor)
+        else:
+            current = _area_downsample(premultiplied, factor)
+        current_factor = factor
+        levels[factor] = _to_rgba(current)
+    return levels
+
+
+def scale_intrinsics(meta, factor):
+    meta = dict(meta)
+    for key in PIXEL_INTRINSICS:
+        if key in ('w', 'h') and key in meta:
+            # matches the cropping in _area_downsample
+            meta[key] = float(int(meta[key]) // factor)
+        elif key in meta:
+            meta[key] = meta[key] / factor
+    return meta
+
+
+def scale_folder(output_dir, factor):
+    if factor == 1:
+        return output_dir
+    return os.path.join(output_dir, SCALE_FOLDER.format(factor))
@@ -1,25 +1,37 @@
 import os
 import math
 import numpy as np
-import json
 import posixpath
 import random
 import shutil
 import pathlib
+from vtkmodules.vtkCommonCore import vtkUnsignedCharArray
 from vtkmodules.vtkIOImage import (
     vtkPNGWriter
 )
 from vtkmodules.vtkRenderingCore import (
     vtkWindowToImageFilter
 )
-from src.utils import make_or_clean_dir, get_numpy_transform_matrix, convert_blender_transform_matrix, fix_transform_file_path
+from vtkmodules.util.numpy_support import vtk_to_numpy
+from src.utils import make_or_clean_dir, get_numpy_transform_matrix, convert_blender_transform_matrix
+from src.model.pose_table import PoseTable, POSE_TABLE_EXTENSION
+from src.export.packed import PackedDatasetWriter, png_to_packed, write_rgba, COMPRESSION_RAW
+from src.export.multiscale import build_pyramid, scale_intrinsics, scale_folder
+from src.pipeline import set_projection_mode
+from src.export.colmap import ColmapJob, ColmapRunner, ColmapError, run_colmap_jobs, run_colmap2nerf, \
+    intrinsics_from_camera, MODE_KNOWN_POSES, DEFAULT_TIMEOUT, DEFAULT_MAX_WORKERS
 
 
 DEFAULT_FOLDER = os.path.normpath('../output')
-COLMAP_PATH = os.path.normpath('../COLMAP/COLMAP.bat')
 COLMAP2NERF_PATH = os.path.normpath('colmap2nerf.py')
 RANDOM_SEED = 2000
 IMAGE_EXTENSION = 'png'
+PACKED_FOLDER = 'packed'
+POSE_TABLE_FILE = f'poses{POSE_TABLE_EXTENSION}'
+DEFAULT_AZIMUTH_STEP = 10
+DEFAULT_ELEVATION_STEP = 15
+MAX_AZIMUTH = 360
+MAX_ELEVATION = 120
 
 
 def write_image(render_window, output_path):
@@ -37,29 +49,99 @@ def write_image(render_window, output_path):
     writer.Write()
 
 
+class FrameCapture(object):
+    # Reads the RGBA framebuffer into one vtkUnsignedCharArray that is reused for every
+    # frame and returns a numpy view of it, flipped to top row first by slicing only.
+    # The view is overwritten by the next capture; copy it to keep a frame.
+    def __init__(self, render_window):
+        self.render_window = render_window
+        self._pixels = vtkUnsignedCharArray()
+        self._pixels.SetNumberOfComponents(4)
+        self._view = None
+
+    @property
+    def shape(self):
+        w, h = self.render_window.GetSize()
+        return h, w, 4
+
+    def capture(self, out=None):
+        self.render_window.Render()
+        h, w, _ = self.shape
+        # Same buffer vtkWindowToImageFilter reads by default; resized only when the window is
+        self.render_window.GetRGBACharPixelData(0, 0, w - 1, h - 1, 1, self._pixels)
+        if self._view is None or self._view.shape != (h, w, 4):
+            self._view = vtk_to_numpy(self._pixels).reshape(h, w, 4)[::-1]
+        if out is None:
+            return self._view
+        np.copyto(out, self._view)
+        return out
+
+    def capture_batch(self, poses, apply_pose, out=None):
+        # Every pose of a schedule into one (N, H, W, 4) array; apply_pose(pose) moves the camera
+        poses = list(poses)
+        if out is None:
+            out = np.empty((len(poses),) + self.shape, dtype=np.uint8)
+        elif out.shape != (len(poses),) + self.shape:
+            raise ValueError(f"Output shape {out.shape} does not match {(len(poses),) + self.shape}")
+        for idx, pose in enumerate(poses):
+            apply_pose(pose)
+            self.capture(out[idx])
+        return out
+
+
+def capture_image(render_window):
+    # RGBA framebuffer as an (H, W, 4) uint8 array, top row first like the PNG files
+    return FrameCapture(render_window).capture()
+
+
+def count_schedule_poses(azimuth_step=DEFAULT_AZIMUTH_STEP, elevation_step=DEFAULT_ELEVATION_STEP):
+    # Frames export_to_nerf renders, whether or not COLMAP registers them afterwards
+    return int(MAX_AZIMUTH / azimuth_step) * int(MAX_ELEVATION / elevation_step)
+
+
 def export_to_nerf(camera,
                    render_window,
                    output_dir=DEFAULT_FOLDER,
-                   azimuth_step=10,
-                   elevation_step=15,
+                   azimuth_step=DEFAULT_AZIMUTH_STEP,
+                   elevation_step=DEFAULT_ELEVATION_STEP,
                    azimuth_step_test=2,
                    export_transform_json=False,
-                   show_preview=True):
+                   show_preview=True,
+                   packed_output=False,
+                   packed_compression=COMPRESSION_RAW,
+                   keep_loose_images=True,
+                   colmap_mode=MODE_KNOWN_POSES,
+                   colmap_executable=None,
+                   colmap_timeout=DEFAULT_TIMEOUT,
+                   colmap_workers=DEFAULT_MAX_WORKERS,
+                   scales=(1,),
+                   projection_mode=None,
+                   slab_thickness=None,
+                   slab_normal=(0, 1, 0)):
 
     # Make path and write file
     if render_window is None:
         return
 
     output_folder_name = f'output_as{azimuth_step}_es{elevation_step}'
-    output_dir = os.path.join(DEFAULT_FOLDER, output_folder_name)
+    output_dir = os.path.join(output_dir, output_folder_name)
     make_or_clean_dir(output_dir)
+    # Every pose is rendered once at full size, the other scales are downsampled from that frame
+    scales = sorted(set(scales) | {1})
+    dataset_dirs = [scale_folder(output_dir, scale) for scale in scales]
+
+    if projection_mode is not None:
+        volumes = render_window.GetRenderers().GetFirstRenderer().GetVolumes()
+        volumes.InitTraversal()
+        for _ in range(volumes.GetNumberOfItems()):
+            set_projection_mode(volumes.GetNextVolume(), projection_mode, slab_thickness, slab_normal)
 
     if not show_preview:
         render_window.ShowWindowOff()
     else:
         render_window.ShowWindowOn()
-    max_azimuth = 360
-    max_elevation = 120
+    max_azimuth = MAX_AZIMUTH
+    max_elevation = MAX_ELEVATION
     camera.Elevation(- max_elevation / 2)  # set elevation to below plane
 
     camera_angle = math.radians(camera.GetViewAngle())
@@ -71,8 +153,19 @@ def export_to_nerf(camera,
     elv_it = np.zeros(int(max_elevation / elevation_step)) + elevation_step
 
 
-    # JSON
-    json_out = {}
+    capture = FrameCapture(render_window)
+    # Scales COLMAP never reads are packed straight from the captured frames, without a PNG
+    # round trip; the full size frames stay loose PNGs when COLMAP needs them
+    direct_scales = [scale for scale in scales if packed_output and (export_transform_json or scale != 1)]
+    writers = {scale: PackedDatasetWriter(os.path.join(dataset_dir, PACKED_FOLDER), compression=packed_compression)
+               for scale, dataset_dir in zip(scales, dataset_dirs) if scale in direct_scales}
+    # rendered path -> stored image record, per directly packed scale
+    packed_images = {scale: {} for scale in direct_scales}
+
+    # Poses
+    w, h, fl_x, fl_y, cx, cy = intrinsics_from_camera(camera, render_window)
+    poses = PoseTable(meta={"camera_angle_x": camera_angle, "fl_x": fl_x, "fl_y": fl_y,
+                            "cx": cx, "cy": cy, "w": float(w), "h": float(h)})
     folder_names = ['train', 'test', 'val']
     num_images = azm_it.size * elv_it.size
     # num_train = int(num_images / 2)
@@ -82,12 +175,11 @@ def export_to_nerf(camera,
     # shuffle order
     np.random.seed(RANDOM_SEED)
     np.random.shuffle(folder_distribution)
-    for folder_name in folder_names:
-        make_or_clean_dir(os.path.join(output_dir, folder_name))
-        json_out[folder_name] = {
-            "camera_angle_x": camera_angle,
-            "frames": []
-        }
+    for scale, dataset_dir in zip(scales, dataset_dirs):
+        if scale in direct_scales:
+            continue
+        for folder_name in folder_names:
+            make_or_clean_dir(os.path.join(dataset_dir, folder_name))
     # Split
     random.seed(2000)
 
@@ -96,6 +188,8 @@ def export_to_nerf(camera,
 
     # Validation dataset
     test_files = []
+    # Raw VTK model-view matrices, handed to COLMAP in known poses mode
+    view_matrices = []
 
     for idx, elevation in np.ndenumerate(elv_it):
         for azimuth in np.nditer(azm_it):
@@ -104,7 +198,9 @@ def export_to_nerf(camera,
             # print("Position: ", camera.GetPosition())
             # print("Orientation: ", camera.GetOrientation())
             # print("Matrix: ", camera.GetModelViewTransformMatrix())
-            transform_matrix = convert_blender_transform_matrix(get_numpy_transform_matrix(camera), camera)
+            view_matrix = get_numpy_transform_matrix(camera)
+            view_matrices.append(view_matrix)
+            transform_matrix = convert_blender_transform_matrix(view_matrix, camera)
             # print("Camera matrix", transform_matrix_np)
             folder_name = folder_distribution[count_train + count_val]
 
@@ -116,14 +212,20 @@ def export_to_nerf(camera,
                 count_val += 1
 
             file_path = os.path.join(output_dir, folder_name, f'{filename}.{IMAGE_EXTENSION}')
-            write_image(render_window, file_path)
-            # JSON
             # p_path = posixpath.join('./', folder_name, filename)  # use this to conform with path standard
             p_path = posixpath.join('./', pathlib.Path(os.path.relpath(file_path, output_dir)).as_posix())
-            json_out[folder_name]["frames"].append({
-                "file_path": p_path,
-                "transform_matrix": transform_matrix.tolist()
-            })
+            if len(scales) > 1 or direct_scales:
+                levels = build_pyramid(capture.capture(), scales)
+                for scale, dataset_dir in zip(scales, dataset_dirs):
+                    if scale in direct_scales:
+                        packed_images[scale][p_path] = writers[scale].add_image(levels[scale])
+                        continue
+                    level_path = os.path.join(dataset_dir, folder_name, f'{filename}.{IMAGE_EXTENSION}')
+                    print("Writing to", level_path)
+                    write_rgba(level_path, levels[scale])
+            else:
+                write_image(render_window, file_path)
+            poses.append(transform_matrix, p_path, folder_name)
 
             # Keep track of the filepaths of the validation dataset for copying
             if idx[0] == int(elv_it.size / 2):
@@ -152,100 +254,96 @@ def export_to_nerf(camera,
     #     count += 1
 
     if export_transform_json:
-        for folder_name in folder_names:
-            json_path = os.path.join(output_dir, f'transforms_{folder_name}.json')
-            with open(json_path, 'w') as outfile:
-                outfile.write(json.dumps(json_out[folder_name]))
+        train_poses = poses.select('train')
     else:
         # run colmap
+        train_poses = PoseTable(meta=poses.meta)
+        intrinsics = intrinsics_from_camera(camera, render_window)
+        jobs = []
         for folder_name in folder_names:
             # skip test and val because we are going to create it later from generated COLMAPs
             if folder_name == 'test' or folder_name == 'val':
                 continue
-            workspace_path = os.path.join(output_dir, f"{folder_name}_colmap")
-            colmap_text_path = os.path.join(output_dir, f"{folder_name}_colmap", 'text')
-            if not os.path.isdir(workspace_path):
-                os.makedirs(workspace_path)
-            if not os.path.isdir(colmap_text_path):
-                os.makedirs(colmap_text_path)
-            os.system(f"{COLMAP_PATH} automatic_reconstructor\
-                      --dense 0\
-                      --single_camera 0\
-                      --workspace_path {workspace_path}\
-                      --image_path {os.path.join(output_dir, folder_name)}")
-
-            sparse_path = os.path.join(workspace_path, 'sparse', '0')
-            if os.path.isdir(sparse_path):
-                os.system(f"{COLMAP_PATH} model_converter --input_path {sparse_path}\
-                 --output_path {colmap_text_path} --output_type TXT")
-
-                # Convert from colmap to nerf transform.json
-                json_path = os.path.join(output_dir, f'transforms_{folder_name}.json')
-                os.system(f"python {COLMAP2NERF_PATH} --text {colmap_text_path} \
-                --aabb_scale 1 \
-                --images {os.path.join(output_dir, folder_name)} \
-                --out {json_path}")
-
-                fix_transform_file_path(json_path, output_dir)
-                shutil.rmtree(workspace_path)
-            else:
-                print(f"Error: No COLMAP convergence in {folder_name}")
+            indices = np.flatnonzero(poses.split_labels == folder_name)
+            job = ColmapJob(folder_name,
+                            os.path.join(output_dir, folder_name),
+                            os.path.join(output_dir, f"{folder_name}_colmap"))
+            if colmap_mode == MODE_KNOWN_POSES:
+                job.image_names = [posixpath.basename(path) for path in poses.paths[indices]]
+                job.view_matrices = [view_matrices[index] for index in indices]
+                job.intrinsics = intrinsics
+            jobs.append(job)
 
+        runner = ColmapRunner(colmap_executable, colmap_timeout)
+        for result in run_colmap_jobs(jobs, runner, colmap_workers):
+            job = result.job
+            if not result.ok:
+                continue
+            # Convert from colmap to nerf pose table, the json is written once all splits are known
+            table_path = os.path.join(job.workspace_path, f'transforms_{job.name}{POSE_TABLE_EXTENSION}')
+            try:
+                run_colmap2nerf(COLMAP2NERF_PATH, job.text_path, job.image_path,
+                                os.path.join(job.workspace_path, f'transforms_{job.name}.json'),
+                                table_path, timeout=colmap_timeout)
+            except ColmapError as e:
+                print(f"Error: {e}")
+                print(e.output)
+                continue
+            train_poses = PoseTable.load(table_path)
+            train_poses.make_paths_relative(output_dir)
+            shutil.rmtree(job.workspace_path)
+
+    # Test and val datasets are copies of the middle elevation ring of the train dataset.
+    # Test keeps the render order, val keeps the order of the train poses.
     print("Creating test dataset...")
-    # Create test images
-    # Read back json file
-    json_path = os.path.join(output_dir, f'transforms_train.json')
-    folder_name = 'test'
     print("Test files:", test_files)
-    with open(json_path) as file:
-        data = json.load(file)
-        index = 0
-        new_data = data.copy()
-        new_data['frames'] = []
-        for path in test_files:
-            for frame in data['frames']:
-                if frame['file_path'] == path:
-                    path = frame['file_path']
-                    # print("Found path:", path)
-                    # Copy image according to val_files to val folder
-                    filename = f'r_{index}'
-                    json_file_path = posixpath.join('./', folder_name, filename)
-                    file_path = os.path.join(output_dir, folder_name, f'{filename}.{IMAGE_EXTENSION}')
-                    shutil.copyfile(os.path.join(output_dir, path), file_path)
-                    index += 1
-                    frame['file_path'] = json_file_path
-                    new_data['frames'].append(frame)
-                    data['frames'].remove(frame)
-
-    json_path_val = os.path.join(output_dir, f'transforms_{folder_name}.json')
-    with open(json_path_val, 'w') as outfile:
-        outfile.write(json.dumps(new_data))
-
-    print("Creating val dataset...")
-    # Create test images
-    # Read back json file
-    json_path = os.path.join(output_dir, f'transforms_train.json')
-    folder_name = 'val'
-    # print("Test files:", test_files)
-    with open(json_path) as file:
-        data = json.load(file)
-        index = 0
-        new_data = data.copy()
-        new_data['frames'] = []
-        for frame in data['frames']:
-            if frame['file_path'] in test_files:
-                path = frame['file_path']
-                # print("Found path:", path)
-                # Copy image according to val_files to val folder
-                filename = f'r_{index}'
-                json_file_path = posixpath.join('./', folder_name, filename)
-                file_path = os.path.join(output_dir, folder_name, f'{filename}.{IMAGE_EXTENSION}')
-                shutil.copyfile(os.path.join(output_dir, path), file_path)
-                index += 1
-                frame['file_path'] = json_file_path
-                new_data['frames'].append(frame)
-                data['frames'].remove(frame)
-
-    json_path_val = os.path.join(output_dir, f'transforms_{folder_name}.json')
-    with open(json_path_val, 'w') as outfile:
-        outfile.write(json.dumps(new_data))
+    test_indices = train_poses.find_paths(test_files)
+    test_indices = test_indices[test_indices >= 0]
+    val_indices = np.sort(test_indices)
+    split_poses = [train_poses]
+    # Rendered frame behind every pose of the final table, test and val reuse train frames
+    source_paths = [train_poses.paths]
+    for folder_name, indices in (('test', test_indices), ('val', val_indices)):
+        if folder_name == 'val':
+            print("Creating val dataset...")
+        split = train_poses.take(indices)
+        split.set_split(folder_name)
+        filenames = [f'r_{index}' for index in range(len(split))]
+        source_paths.append(split.paths.copy())
+        for path, filename in zip(split.paths, filenames):
+            for scale, dataset_dir in zip(scales, dataset_dirs):
+                if scale in direct_scales:
+                    continue
+                shutil.copyfile(os.path.join(dataset_dir, path),
+                                os.path.join(dataset_dir, folder_name, f'{filename}.{IMAGE_EXTENSION}'))
+        split.set_paths([posixpath.join('./', folder_name, filename) for filename in filenames])
+        split_poses.append(split)
+
+    poses = PoseTable.concatenate(split_poses)
+    source_paths = np.concatenate(source_paths)
+    full_meta = poses.meta
+    for scale, dataset_dir in zip(scales, dataset_dirs):
+        poses.meta = scale_intrinsics(full_meta, scale)
+        poses.save(os.path.join(dataset_dir, POSE_TABLE_FILE))
+        poses.write_transforms(dataset_dir, folder_names)
+        if scale in direct_scales:
+            writer = writers[scale]
+            for folder_name in folder_names:
+                writer.set_split_meta(folder_name, poses.meta)
+            for idx, (path, source, split, matrix) in enumerate(zip(poses.paths, source_paths,
+                                                                    poses.split_labels, poses.matrices)):
+                columns = {name: poses.column(name)[idx] for name in poses.column_names}
+                writer.add_pose(packed_images[scale][source], split, path, matrix, **columns)
+            writer.close()
+            print(f"Packed {dataset_dir} into {os.path.join(dataset_dir, PACKED_FOLDER)}")
+
+    if packed_output:
+        for scale, dataset_dir in zip(scales, dataset_dirs):
+            if scale in direct_scales:
+                continue
+            png_to_packed(dataset_dir, os.path.join(dataset_dir, PACKED_FOLDER), compression=packed_compression)
+            if not keep_loose_images:
+                for folder_name in folder_names:
+                    shutil.rmtree(os.path.join(dataset_dir, folder_name))
+
+    return poses
@@ -0,0 +1,242 @@
+import os
+import json
+import zlib
+import hashlib
+import numpy as np
+import cv2
+from src.utils import make_or_clean_dir
+from src.model.pose_table import PoseTable, SPLITS, POSE_TABLE_EXTENSION
+
+
+# Packed dataset layout:
+#   <packed_dir>/index.json        per-split intrinsics and per-frame offsets
+#   <packed_dir>/poses.npz         PoseTable with poses, paths and split labels
+#   <packed_dir>/shard_00000.bin   concatenated RGBA frames (raw or zlib)
+#   <packed_dir>/shard_00001.bin   ...
+INDEX_FILE = 'index.json'
+POSE_TABLE_FILE = f'poses{POSE_TABLE_EXTENSION}'
+SHARD_NAME = 'shard_{:05d}.bin'
+DEFAULT_FRAMES_PER_SHARD = 256
+COMPRESSION_RAW = 'raw'
+COMPRESSION_ZLIB = 'zlib'
+ZLIB_LEVEL = 1
+PNG_EXTENSION = 'png'
+
+
+class PackedDatasetWriter(object):
+    def __init__(self, output_dir, frames_per_shard=DEFAULT_FRAMES_PER_SHARD,
+                 compression=COMPRESSION_RAW, dedupe=True):
+        if compression not in (COMPRESSION_RAW, COMPRESSION_ZLIB):
+            raise ValueError(f"Unknown compression: {compression}")
+        make_or_clean_dir(output_dir)
+        self._output_dir = output_dir
+        self._frames_per_shard = frames_per_shard
+        self._compression = compression
+        self._dedupe = dedupe
+        # content hash -> (shard, offset, nbytes), so the test/val frames that
+        # duplicate train frames are stored only once
+        self._blobs = {}
+        self._shard_file = None
+        self._shard_frames = 0
+        self._poses = PoseTable()
+        self._index = {
+            "version": 1,
+            "compression": compression,
+            "shards": [],
+            "splits": {},
+            "frames": []
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_split_meta(self, split, meta):
+        # Everything in transforms_<split>.json except the frames (camera_angle_x, fl_x, w, h...)
+        self._index["splits"][split] = dict(meta)
+
+    def _open_next_shard(self):
+        if self._shard_file is not None:
+            self._shard_file.close()
+        name = SHARD_NAME.format(len(self._index["shards"]))
+        self._index["shards"].append(name)
+        self._shard_file = open(os.path.join(self._output_dir, name), 'wb')
+        self._shard_frames = 0
+
+    def _write_blob(self, data):
+        key = hashlib.blake2b(data, digest_size=16).hexdigest() if self._dedupe else None
+        if key is not None and key in self._blobs:
+            return self._blobs[key]
+        if self._shard_file is None or self._shard_frames >= self._frames_per_shard:
+            self._open_next_shard()
+        location = (len(self._index["shards"]) - 1, self._shard_file.tell(), len(data))
+        self._shard_file.write(data)
+        self._shard_frames += 1
+        if key is not None:
+            self._blobs[key] = location
+        return location
+
+    def add_image(self, rgba):
+        # Stores the pixels only; the returned record is given to add_pose once the pose is known
+        rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+        if rgba.ndim != 3 or rgba.shape[2] != 4:
+            raise ValueError(f"Expected an (H, W, 4) RGBA frame, got {rgba.shape}")
+        data = rgba.tobytes()
+        if self._compression == COMPRESSION_ZLIB:
+            data = zlib.compress(data, ZLIB_LEVEL)
+        shard, offset, nbytes = self._write_blob(data)
+        return {
+            "shard": shard,
+            "offset": offset,
+            "nbytes": nbytes,
+            "shape": list(rgba.shape)
+        }
+
+    def add_pose(self, image, split, file_path, transform_matrix, **columns):
+        # A frame of the dataset pointing at a stored image; several frames may share one
+        self._index["frames"].append(dict(image))
+        return self._poses.append(transform_matrix, file_path, split, **columns)
+
+    def add_frame(self, rgba, split, file_path, transform_matrix, **columns):
+        return self.add_pose(self.add_image(rgba), split, file_path, transform_matrix, **columns)
+
+    def close(self):
+        if self._shard_file is not None:
+            self._shard_file.close()
+            self._shard_file = None
+        self._poses.save(os.path.join(self._output_dir, POSE_TABLE_FILE))
+        with open(os.path.join(self._output_dir, INDEX_FILE), 'w') as outfile:
+            outfile.write(json.dumps(self._index))
+
+
+class PackedDatasetReader(object):
+    def __init__(self, packed_dir):
+        self._packed_dir = packed_dir
+        with open(os.path.join(packed_dir, INDEX_FILE)) as file:
+            self._index = json.load(file)
+        self._compression = self._index["compression"]
+        self.poses = PoseTable.load(os.path.join(packed_dir, POSE_TABLE_FILE))
+        self._shards = [None] * len(self._index["shards"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._index["frames"])
+
+    def __getitem__(self, idx):
+        return self.get_image(idx)
+
+    def _get_shard(self, shard):
+        # Shards are mapped on first use, so opening a dataset costs only the index read
+        if self._shards[shard] is None:
+            path = os.path.join(self._packed_dir, self._index["shards"][shard])
+            self._shards[shard] = np.memmap(path, dtype=np.uint8, mode='r')
+        return self._shards[shard]
+
+    @property
+    def splits(self):
+        return list(self._index["splits"].keys())
+
+    def split_meta(self, split):
+        return dict(self._index["splits"].get(split, {}))
+
+    def split_indices(self, split):
+        return np.flatnonzero(self.poses.splits == SPLITS.index(split))
+
+    def split_poses(self, split):
+        poses = self.poses.select(split)
+        poses.meta = self.split_meta(split)
+        return poses
+
+    def get_transform_matrix(self, idx):
+        return self.poses.matrices[idx]
+
+    def get_image(self, idx):
+        # Raw frames are returned as a read-only view into the mapped shard, zlib frames are decoded
+        frame = self._index["frames"][idx]
+        shard = self._get_shard(frame["shard"])
+        blob = shard[frame["offset"]:frame["offset"] + frame["nbytes"]]
+        if self._compression == COMPRESSION_ZLIB:
+            return np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(frame["shape"])
+        return blob.reshape(frame["shape"])
+
+    def close(self):
+        self._shards = [None] * len(self._shards)
+
+
+def resolve_image_path(dataset_dir, file_path):
+    # transforms_test.json / transforms_val.json store paths without the extension
+    path = os.path.normpath(os.path.join(dataset_dir, file_path))
+    if not os.path.splitext(path)[1]:
+        path = f'{path}.{PNG_EXTENSION}'
+    return path
+
+
+def read_rgba(path):
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise IOError(f"Failed to read image {path}")
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGBA)
+    if image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGBA)
+    return cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA)
+
+
+def write_rgba(path, rgba):
+    if not cv2.imwrite(path, cv2.cvtColor(np.asarray(rgba), cv2.COLOR_RGBA2BGRA)):
+        raise IOError(f"Failed to write image {path}")
+
+
+def png_to_packed(dataset_dir, packed_dir, frames_per_shard=DEFAULT_FRAMES_PER_SHARD,
+                  compression=COMPRESSION_RAW):
+    with PackedDatasetWriter(packed_dir, frames_per_shard, compression) as writer:
+        for split in SPLITS:
+            json_path = os.path.join(dataset_dir, f'transforms_{split}.json')
+            if not os.path.isfile(json_path):
+                continue
+            poses = PoseTable.from_json(json_path, split)
+            writer.set_split_meta(split, poses.meta)
+            for idx, (path, matrix) in enumerate(zip(poses.paths, poses.matrices)):
+                columns = {name: poses.column(name)[idx] for name in poses.column_names}
+                rgba = read_rgba(resolve_image_path(dataset_dir, path))
+                writer.add_frame(rgba, split, path, matrix, **columns)
+    print(f"Packed {dataset_dir} into {packed_dir}")
+
+
+def packed_to_png(packed_dir, dataset_dir):
+    with PackedDatasetReader(packed_dir) as reader:
+        for split in reader.splits:
+            os.makedirs(os.path.join(dataset_dir, split), exist_ok=True)
+            for idx, path in zip(reader.split_indices(split), reader.poses.select(split).paths):
+                path = resolve_image_path(dataset_dir, path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_rgba(path, reader.get_image(idx))
+            reader.split_poses(split).write_json(os.path.join(dataset_dir, f'transforms_{split}.json'))
+    print(f"Unpacked {packed_dir} into {dataset_dir}")
+
+
+def get_program_parameters():
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert between the PNG + transforms_*.json layout '
+                                                 'and the packed shard layout.')
+    parser.add_argument('direction', choices=['pack', 'unpack'])
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    parser.add_argument('--frames-per-shard', type=int, default=DEFAULT_FRAMES_PER_SHARD)
+    parser.add_argument('--compression', default=COMPRESSION_RAW, choices=[COMPRESSION_RAW, COMPRESSION_ZLIB])
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_program_parameters()
+    if args.direction == 'pack':
+        png_to_packed(args.source, args.destination, args.frames_per_shard, args.compression)
+    else:
+        packed_to_png(args.source, args.destination)
@@ -23,3 +23,19 @@ class DirectoryInput(Input):
             self._filenames = dirs
         else:
             print("Error in DirectoryInput: not a directory")
+
+
+class SeriesDirectoryInput(DirectoryInput):
+    # File names of one series in slice order, read from the folder's header index
+    # (see SeriesIndex) instead of a plain listing. get_data() is the series summary.
+    def load_from_dir(self, directory, series_uid=None, workers=None):
+        from src.input.SeriesIndex import index_directory
+        if not os.path.isdir(directory):
+            print("Error in SeriesDirectoryInput: not a directory")
+            return
+        index = index_directory(directory, workers)
+        series = index.default_series() if series_uid is None else index.series[series_uid]
+        if series["flags"]:
+            print(f"Warning: series {series['uid']}: {', '.join(series['flags'])}")
+        self._data = series
+        self._filenames = [os.path.join(directory, path) for path in series["files"]]
@@ -0,0 +1,266 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+INDEX_FILE = '.dicom_index.json'
+SERIES_LINK_FOLDER = '.series'
+INDEX_VERSION = 1
+# Tags read from every file; parsing stops before the pixel data
+HEADER_TAGS = [
+    'StudyInstanceUID', 'SeriesInstanceUID', 'SeriesNumber', 'SeriesDescription', 'Modality', 'ImageType',
+    'InstanceNumber', 'ImagePositionPatient', 'ImageOrientationPatient', 'PixelSpacing', 'SliceThickness',
+    'Rows', 'Columns', 'BitsAllocated'
+]
+# Relative deviation from the median slice spacing that counts as uneven
+SPACING_TOLERANCE = 0.01
+# A spacing this many times the median means slices are missing
+GAP_FACTOR = 1.5
+MIN_SLICES = 3
+CACHE_FOLDER = 'dicom-volume-rendering'
+
+
+def user_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, CACHE_FOLDER)
+
+
+def index_dir_for(directory, index_dir=None):
+    # Where the index and series links of a study go: index_dir if given, the study folder
+    # if it is writable, otherwise a per-study folder in the user cache (read-only shares)
+    if index_dir is None and os.access(directory, os.W_OK):
+        return directory
+    key = hashlib.sha1(os.path.abspath(directory).encode()).hexdigest()[:16]
+    return os.path.join(index_dir or user_cache_dir(), f'{os.path.basename(os.path.abspath(directory))}_{key}')
+
+
+def _to_json_value(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)) or type(value).__name__ == 'MultiValue':
+        return [_to_json_value(item) for item in value]
+    # pydicom's IS / DSfloat are subclasses of int / float
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return str(value)
+
+
+def read_header(path):
+    # Header of one file as a plain dict, None if it is not a DICOM file
+    import pydicom
+    from pydicom.errors import InvalidDicomError
+    try:
+        dataset = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+    except (InvalidDicomError, OSError, ValueError):
+        return None
+    if 'SeriesInstanceUID' not in dataset:
+        return None
+    return {tag: _to_json_value(dataset.get(tag)) for tag in HEADER_TAGS}
+
+
+def _list_files(directory):
+    files = {}
+    for root, dirs, names in os.walk(directory):
+        # skip the index's own link folders and other hidden folders
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            files[os.path.relpath(path, directory)] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _slice_positions(headers):
+    # Distance of each slice along the slice normal, InstanceNumber if the geometry is missing
+    orientation = headers[0].get('ImageOrientationPatient')
+    if orientation and all(header.get('ImagePositionPatient') for header in headers):
+        normal = np.cross(orientation[:3], orientation[3:])
+        return np.array([np.dot(normal, header['ImagePositionPatient']) for header in headers]), True
+    return np.array([header.get('InstanceNumber') or 0 for header in headers], dtype=np.float64), False
+
+
+def summarize_series(uid, entries):
+    # entries: [(relative path, header)] of one series -> sorted files and quality flags
+    headers = [header for _, header in entries]
+    positions, has_geometry = _slice_positions(headers)
+    order = np.argsort(positions, kind='stable')
+    positions = positions[order]
+    first = headers[order[0]]
+    flags = []
+    image_type = [str(value).upper() for value in (first.get('ImageType') or [])]
+    if 'LOCALIZER' in image_type or len(entries) < MIN_SLICES:
+        flags.append('localizer')
+    if not has_geometry:
+        flags.append('no_geometry')
+    orientations = {tuple(np.round(header.get('ImageOrientationPatient') or [], 4)) for header in headers}
+    if len(orientations) > 1:
+        flags.append('mixed_orientation')
+    spacing = None
+    missing = 0
+    if has_geometry and len(positions) > 1:
+        steps = np.diff(positions)
+        if np.any(np.isclose(steps, 0)):
+            flags.append('duplicate_positions')
+        steps = steps[~np.isclose(steps, 0)]
+        if steps.size:
+            spacing = float(np.median(steps))
+            gaps = steps > spacing * GAP_FACTOR
+            if gaps.any():
+                missing = int(np.sum(np.round(steps[gaps] / spacing) - 1))
+                flags.append('missing_slices')
+            if np.any(np.abs(steps[~gaps] - spacing) > SPACING_TOLERANCE * spacing):
+                flags.append('uneven_spacing')
+    return {
+        "uid": uid,
+        "study_uid": first.get('StudyInstanceUID'),
+        "number": first.get('SeriesNumber'),
+        "description": first.get('SeriesDescription'),
+        "modality": first.get('Modality'),
+        "files": [entries[idx][0] for idx in order],
+        "slices": len(entries),
+        "dimensions": [first.get('Columns'), first.get('Rows'), len(entries)],
+        "pixel_spacing": first.get('PixelSpacing'),
+        "slice_spacing": spacing,
+        "missing_slices": missing,
+        "flags": flags
+    }
+
+
+class SeriesIndex(object):
+    # Header index of a study folder, saved next to the data or, for read-only studies,
+    # in the user cache (see index_dir_for). Updating only re-reads
+    # files whose size or modification time changed, so later loads and batch scans
+    # skip discovery entirely.
+    def __init__(self, directory, index_path=None, link_root=None, index_dir=None):
+        self.directory = directory
+        location = index_dir_for(directory, index_dir)
+        self.index_path = index_path or os.path.join(location, INDEX_FILE)
+        self.link_root = link_root or os.path.join(location, SERIES_LINK_FOLDER)
+        self.files = {}
+        self.series = {}
+
+    def load(self):
+        if not os.path.isfile(self.index_path):
+            return False
+        with open(self.index_path) as file:
+            data = json.load(file)
+        if data.get("version") != INDEX_VERSION:
+            return False
+        self.files = data["files"]
+        self.series = data["series"]
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        with open(self.index_path, 'w') as outfile:
+            outfile.write(json.dumps({"version": INDEX_VERSION, "files": self.files, "series": self.series}))
+
+    def update(self, workers=None, rebuild=False):
+        # Returns the number of headers that had to be read
+        if not rebuild:
+            self.load()
+        else:
+            self.files = {}
+        current = _list_files(self.directory)
+        files = {}
+        stale = []
+        for path, (mtime, size) in current.items():
+            entry = self.files.get(path)
+            if entry is not None and entry["mtime_ns"] == mtime and entry["size"] == size:
+                files[path] = entry
+            else:
+                stale.append(path)
+        if stale:
+            paths = [os.path.join(self.directory, path) for path in stale]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                headers = list(executor.map(read_header, paths, chunksize=max(1, len(paths) // 64)))
+            for path, header in zip(stale, headers):
+                mtime, size = current[path]
+                files[path] = {"mtime_ns": mtime, "size": size, "header": header}
+        changed = bool(stale) or set(files) != set(self.files)
+        self.files = files
+        if changed or not self.series:
+            self._group()
+            self.save()
+        return len(stale)
+
+    def _group(self):
+        groups = {}
+        for path, entry in self.files.items():
+            header = entry["header"]
+            if header is not None:
+                groups.setdefault(header["SeriesInstanceUID"], []).append((path, header))
+        self.series = {uid: summarize_series(uid, entries) for uid, entries in groups.items()}
+
+    def default_series(self):
+        # The largest series that is not a localizer
+        candidates = [series for series in self.series.values() if 'localizer' not in series["flags"]] \
+            or list(self.series.values())
+        if not candidates:
+            raise ValueError(f"No DICOM series in {self.directory}")
+        return max(candidates, key=lambda series: series["slices"])
+
+    def series_folder(self, uid=None):
+        # vtkDICOMImageReader reads whole folders. A folder that holds only the chosen series
+        # is used as is, otherwise the series is linked into <link_root>/<uid>.
+        series = self.default_series() if uid is None else self.series[uid]
+        files = series["files"]
+        folders = {os.path.dirname(path) for path in files}
+        if len(folders) == 1:
+            folder = folders.pop()
+            siblings = [path for path, entry in self.files.items()
+                        if os.path.dirname(path) == folder and entry["header"] is not None]
+            if len(siblings) == len(files):
+                return os.path.join(self.directory, folder)
+        target = os.path.join(self.link_root, series["uid"])
+        # Links point at inodes (or are copies), so they are rebuilt whenever a source file of
+        # the series changed. The signature sits next to the folder, the reader sees only DICOM files.
+        signature_path = f'{target}.json'
+        names = [f'{idx:05d}_{os.path.basename(path)}' for idx, path in enumerate(files)]
+        signature = [[name, path, self.files[path]["mtime_ns"], self.files[path]["size"]]
+                     for name, path in zip(names, files)]
+        if os.path.isdir(target) and os.path.isfile(signature_path) \
+                and sorted(os.listdir(target)) == names:
+            with open(signature_path) as file:
+                if json.load(file) == signature:
+                    return target
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.makedirs(target)
+        for name, path in zip(names, files):
+            source = os.path.abspath(os.path.join(self.directory, path))
+            # numbered in slice order so the reader's file name sort keeps it
+            link = os.path.join(target, name)
+            # hard links fail across devices (e.g. into the user cache), symlinks where
+            # they are not permitted
+            try:
+                os.link(source, link)
+            except OSError:
+                try:
+                    os.symlink(source, link)
+                except OSError:
+                    shutil.copyfile(source, link)
+        with open(signature_path, 'w') as outfile:
+            outfile.write(json.dumps(signature))
+        return target
+
+
+def index_directory(directory, workers=None, rebuild=False, index_dir=None):
+    index = SeriesIndex(directory, index_dir=index_dir)
+    read = index.update(workers, rebuild)
+    print(f"Indexed {directory}: {len(index.series)} series, {read} headers read, "
+          f"{len(index.files) - read} from the index")
+    return index
+
+
+def resolve_dicom_folder(directory, series_uid=None, workers=None, index_dir=None):
+    # Folder that vtkDICOMImageReader can read as one clean series
+    return index_directory(directory, workers, index_dir=index_dir).series_folder(series_uid)
@@ -1,201 +1,353 @@
-import os, sys
-import numpy as np
-import vtk
-from input import *
+#!/usr/bin/env python
 
+# Only the standard library (and src.authkey, which uses nothing else) is imported here.
+# VTK, numpy and cv2 are imported by each subcommand when it runs, so --help and small
+# jobs do not pay for them.
+import os
+import sys
+import argparse
 
-#!/usr/bin/env python
+from src.authkey import add_authkey_arguments
+
+# Same as src.projection.MODES / PROJECTION_MODES; importing those would pull in numpy
+PROJECTION_CHOICES = ['composite', 'mip', 'minip', 'average']
+INTENSITY_PROJECTION_CHOICES = ['mip', 'minip', 'average']
+DESCRIPTION = 'Read a volume dataset and displays it via volume rendering.'
+EPILOGUE = '''
+    Derived from VTK/Examples/Cxx/Medical4.cxx
+    '''
+IMPORT_REPORT_TOP = 20
+SUBCOMMANDS = ['view', 'export', 'convert-colmap', 'series', 'project', 'index', 'bench', 'serve']
+# Flags of the single-command CLI, renamed on the export subcommand
+LEGACY_RENAMES = {'--export-packed': '--packed', '--no-export-packed': '--no-packed', '--export-scales': '--scales'}
+# Export options the old CLI accepted (and ignored) without --export-nerf; view has no such flags
+LEGACY_EXPORT_FLAGS = ['--export-packed', '--no-export-packed', '--colmap-mode', '--colmap-executable',
+                       '--export-scales']
+
+
+def resolve_series(args):
+    # Point --dicom-folder at a folder holding only the requested (or largest) series
+    if args.index or args.series_uid:
+        from src.input.SeriesIndex import resolve_dicom_folder
+        args.dicom_folder = resolve_dicom_folder(args.dicom_folder, args.series_uid, index_dir=args.index_dir)
+
+
+def view(args):
+    # noinspection PyUnresolvedReferences
+    import vtkmodules.vtkInteractionStyle
+    from vtkmodules.vtkRenderingCore import vtkRenderWindowInteractor
+    from src.pipeline import build_pipeline
+
+    resolve_series(args)
+    pipeline = build_pipeline(args.dicom_folder, size=args.size)
+    pipeline.set_projection_mode(args.projection, args.slab_thickness, args.slab_normal)
+    # Interact with the data.
+    iren = vtkRenderWindowInteractor()
+    iren.SetRenderWindow(pipeline.render_window)
+    iren.Start()
+
+
+def plan_memory_budget(args, volumes=1, colmap=False):
+    # (estimate, fits) for --memory-budget, or (None, None) without a budget
+    if not args.memory_budget:
+        return None, None
+    from src.memory import read_volume_header, plan_memory, parse_size, format_size
+    estimate, fits = plan_memory(read_volume_header(args.dicom_folder), parse_size(args.memory_budget),
+                                 args.size, volumes, getattr(args, 'scales', (1,)), colmap)
+    print(f"Memory plan: {format_size(estimate.total_bytes)} for {estimate.volumes} loaded volume(s)"
+          f"{' and COLMAP' if colmap else ''}, downsample {estimate.downsample}, quantize {estimate.quantize}")
+    return estimate, fits
+
+
+def export(args):
+    from src.pipeline import build_pipeline
+    from src.export.nerf import export_to_nerf, DEFAULT_FOLDER
+    from src.memory import MemoryTracker, parse_size, write_run_summary
 
-# noinspection PyUnresolvedReferences
-import vtkmodules.vtkInteractionStyle
-# noinspection PyUnresolvedReferences
-import vtkmodules.vtkRenderingOpenGL2
-# noinspection PyUnresolvedReferences
-import vtkmodules.vtkRenderingVolumeOpenGL2
-from vtkmodules.vtkCommonColor import vtkNamedColors
-from vtkmodules.vtkCommonDataModel import vtkPiecewiseFunction
-from vtkmodules.vtkIOImage import vtkMetaImageReader
-from vtkmodules.vtkIOImage import (
-    vtkDICOMImageReader,
-)
-from vtkmodules.vtkRenderingCore import (
-    vtkColorTransferFunction,
-    vtkRenderWindow,
-    vtkRenderWindowInteractor,
-    vtkRenderer,
-    vtkVolume,
-    vtkVolumeProperty,
-)
-from vtkmodules.vtkRenderingVolume import vtkGPUVolumeRayCastMapper
-
-from input import *
-from src.model.colormap.Standard import STANDARD
-from src.model.colormap.toRGBPoints import to_rgb_points
-from src.export.nerf import export_to_nerf
-
-def main():
-    colors = vtkNamedColors()
-
-    args = get_program_parameters()
-    file_name = args.dicom_folder
-
-    colors.SetColor('BkgColor', [255, 255, 255, 0])
-
-    # Create the renderer, the render window, and the interactor. The renderer
-    # draws into the render window, the interactor enables mouse- and
-    # keyboard-based interaction with the scene.
-    ren = vtkRenderer()
-    ren_win = vtkRenderWindow()
-    ren_win.AddRenderer(ren)
-
-
-    # The following reader is used to read a series of 2D slices (images)
-    # that compose the volume. The slice dimensions are set, and the
-    # pixel spacing. The data Endianness must also be specified. The reader
-    # uses the FilePrefix in combination with the slice number to construct
-    # filenames using the format FilePrefix.%d. (In this case the FilePrefix
-    # is the root name of the file: quarter.)
-    # reader = vtkMetaImageReader()
-    # reader.SetFileName(file_name)
+    resolve_series(args)
+    # One render process, then COLMAP as a subprocess unless only the json is written
+    estimate, fits = plan_memory_budget(args, colmap=not args.json_only)
+    tracker = MemoryTracker()
+    with tracker.stage('load'):
+        pipeline = build_pipeline(args.dicom_folder, size=args.size,
+                                  downsample=estimate.downsample if estimate else 1,
+                                  quantize=estimate.quantize if estimate else False)
+    with tracker.stage('export'):
+        export_to_nerf(pipeline.camera, render_window=pipeline.render_window, show_preview=False,
+                       export_transform_json=args.json_only,
+                       packed_output=args.packed,
+                       keep_loose_images=not args.packed,
+                       colmap_mode=args.colmap_mode,
+                       colmap_executable=args.colmap_executable,
+                       scales=args.scales,
+                       projection_mode=args.projection,
+                       slab_thickness=args.slab_thickness,
+                       slab_normal=args.slab_normal)
+    write_run_summary(os.path.join(DEFAULT_FOLDER, 'run_summary.json'), tracker, estimate,
+                      parse_size(args.memory_budget) if args.memory_budget else None, fits)
+
+
+def project(args):
+    # Projection straight from the voxels with numpy, no GPU or render window needed
+    from vtkmodules.vtkIOImage import vtkDICOMImageReader
+    from src.projection import volume_from_image, project_axis, project_oblique, projection_to_rgba
+    from src.export.packed import write_rgba
+
+    resolve_series(args)
     reader = vtkDICOMImageReader()
-    reader.SetDirectoryName(file_name)
-
-    # The volume will be displayed by ray-cast alpha compositing.
-    # A ray-cast mapper is needed to do the ray-casting.
-    volume_mapper = vtkGPUVolumeRayCastMapper()
-    volume_mapper.SetInputConnection(reader.GetOutputPort())
-
-    # The color transfer function maps voxel intensities to colors.
-    # It is modality-specific, and often anatomy-specific as well.
-    # The goal is to one color for flesh (between 500 and 1000)
-    # and another color for bone (1150 and over).
-    rgb_points = to_rgb_points(STANDARD)
-    volume_color = vtkColorTransferFunction()
-    # volume_color.AddRGBPoint(0, 0.0, 0.0, 0.0)
-    # volume_color.AddRGBPoint(500, 240.0 / 255.0, 184.0 / 255.0, 160.0 / 255.0)
-    # volume_color.AddRGBPoint(1000, 240.0 / 255.0, 184.0 / 255.0, 160.0 / 255.0)
-    # volume_color.AddRGBPoint(1150, 1.0, 1.0, 240.0 / 255.0)  # Ivory
-    for rgb_point in rgb_points:
-        volume_color.AddRGBPoint(rgb_point[0], rgb_point[1], rgb_point[2], rgb_point[3])
-
-    # The opacity transfer function is used to control the opacity
-    # of different tissue types.
-    volume_scalar_opacity = vtkPiecewiseFunction()
-    volume_scalar_opacity.AddPoint(0, 0.00)
-    volume_scalar_opacity.AddPoint(500, 0.15)
-    volume_scalar_opacity.AddPoint(800, 1.00)
-    # volume_scalar_opacity.AddPoint(1150, 1.00)
-
-    # The gradient opacity function is used to decrease the opacity
-    # in the 'flat' regions of the volume while maintaining the opacity
-    # at the boundaries between tissue types.  The gradient is measured
-    # as the amount by which the intensity changes over unit distance.
-    # For most medical data, the unit distance is 1mm.
-    volume_gradient_opacity = vtkPiecewiseFunction()
-    volume_gradient_opacity.AddPoint(0, 0.0)
-    volume_gradient_opacity.AddPoint(90, 0.5)
-    volume_gradient_opacity.AddPoint(100, 1.0)
-
-    # The VolumeProperty attaches the color and opacity functions to the
-    # volume, and sets other volume properties.  The interpolation should
-    # be set to linear to do a high-quality rendering.  The ShadeOn option
-    # turns on directional lighting, which will usually enhance the
-    # appearance of the volume and make it look more '3D'.  However,
-    # the quality of the shading depends on how accurately the gradient
-    # of the volume can be calculated, and for noisy data the gradient
-    # estimation will be very poor.  The impact of the shading can be
-    # decreased by increasing the Ambient coefficient while decreasing
-    # the Diffuse and Specular coefficient.  To increase the impact
-    # of shading, decrease the Ambient and increase the Diffuse and Specular.
-    volume_property = vtkVolumeProperty()
-    volume_property.SetColor(volume_color)
-    volume_property.SetScalarOpacity(volume_scalar_opacity)
-    volume_property.SetGradientOpacity(volume_gradient_opacity)
-    volume_property.SetInterpolationTypeToLinear()
-    volume_property.ShadeOn()
-    volume_property.SetAmbient(0.4)
-    volume_property.SetDiffuse(1.0)
-    volume_property.SetSpecular(0.4)
-
-    # Extra paraneeters for volume mapper
-    volume_mapper.SetBlendModeToComposite()
-    volume_mapper.SetSampleDistance(0.5)
-    volume_mapper.AutoAdjustSampleDistancesOff()
-    volume_mapper.SetUseJittering(True)
-    volume_mapper.UseJitteringOn()
-
-    # The vtkVolume is a vtkProp3D (like a vtkActor) and controls the position
-    # and orientation of the volume in world coordinates.
-    volume = vtkVolume()
-    volume.SetMapper(volume_mapper)
-    volume.SetProperty(volume_property)
-
-    # Finally, add the volume to the renderer
-    ren.AddViewProp(volume)
-
-    # Set up an initial view of the volume.  The focal point will be the
-    # center of the volume, and the camera position will be 400mm to the
-    # patient's left (which is our right).
-    view_angle = 40.0
-    camera = ren.GetActiveCamera()
-    c = volume.GetCenter()
-    camera.SetViewUp(0, 0, -1)
-    camera.SetFocalPoint(c[0], c[1], c[2])
-    camera.SetViewAngle(view_angle)
-
-    # Position camera so that the volume fit the camera FOV
-    # angle = 2*atan((h/2)/d)
-    # d = (h/2)/tan(angle/2)
-    # vtk's camera Y-axis is the axis that points towards the scene
-    pixel_spacing = reader.GetPixelSpacing()
-    max_x = (volume.GetMaxXBound() + 1)
-    max_y = (volume.GetMaxYBound() + 1)
-    max_z = (volume.GetMaxZBound() + 1)
-    max_dim = np.max([max_x, max_y, max_z])
-    offset = (max_z / 2) / np.tan(np.radians(view_angle / 2)) + (max_x / 2)
-    camera.SetPosition(c[0], c[1] - offset, c[2])
-    camera.SetClippingRange(0.1, offset + max_dim)
-    # camera.SetClippingRange(2.0, 6.0)
-    print("pixel spacing", pixel_spacing)
-    print("volume", max_dim, offset)
-
-    # camera.Azimuth(30.0)
-    # camera.Elevation(30.0)
-
-    # Set a background color for the renderer
-    ren.SetBackground(colors.GetColor3d('BkgColor'))
-
-    # Increase the size of the render window
-    ren_win.SetSize(800, 800)
-    ren_win.SetWindowName('MedicalDemo4')
-    ren_win.SetAlphaBitPlanes(1)
-
-    if args.export_nerf:
-        # export_to_folder(None, render_window=ren_win)
-        export_to_nerf(camera, render_window=ren_win, show_preview=False)
+    reader.SetDirectoryName(args.dicom_folder)
+    reader.Update()
+    volume, spacing = volume_from_image(reader.GetOutput())
+    if args.slab_normal is None:
+        # numpy axis order is (z, y, x)
+        axis = 2 - 'xyz'.index(args.axis)
+        thickness = None if args.slab_thickness is None \
+            else max(1, int(round(args.slab_thickness / spacing[2 - axis])))
+        start = max(0, (volume.shape[axis] - thickness) // 2) if thickness else 0
+        image = project_axis(volume, args.projection, axis, start, thickness)
     else:
-        # Interact with the data.
-        iren = vtkRenderWindowInteractor()
-        iren.SetRenderWindow(ren_win)
-        iren.Start()
+        image = project_oblique(volume, args.projection, args.slab_normal, thickness=args.slab_thickness,
+                                spacing=spacing)
+    write_rgba(args.out, projection_to_rgba(image))
+    print("Writing to", args.out)
 
 
-def get_program_parameters():
-    import argparse
-    description = 'Read a volume dataset and displays it via volume rendering.'
-    epilogue = '''
-    Derived from VTK/Examples/Cxx/Medical4.cxx
-    '''
-    parser = argparse.ArgumentParser(description=description, epilog=epilogue,
+def convert_colmap(args):
+    # colmap2nerf is a standalone script, run it in this interpreter with its own argv
+    import runpy
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'colmap2nerf.py')
+    sys.argv = [script, '--text', args.text, '--images', args.images, '--out', args.out,
+                '--aabb_scale', args.aabb_scale]
+    if args.out_table:
+        sys.argv += ['--out_table', args.out_table]
+    runpy.run_path(script, run_name='__main__')
+
+
+def series(args):
+    from src.series4d import run_series, find_phase_folders
+
+    phase_folders = args.phase_folders or find_phase_folders(args.series_folder)
+    pose = None
+    if args.azimuth is not None or args.elevation is not None:
+        pose = {"azimuth": args.azimuth or 0.0, "elevation": args.elevation or 0.0}
+    options = {}
+    if pose is None:
+        options = dict(export_transform_json=args.json_only,
+                       colmap_mode=args.colmap_mode,
+                       colmap_executable=args.colmap_executable)
+    run_series(phase_folders, size=args.size, pose=pose, output_dir=args.output_dir, baseline=args.baseline,
+               projection_mode=args.projection, slab_thickness=args.slab_thickness,
+               slab_normal=args.slab_normal, **options)
+
+
+def index(args):
+    # Header-only scan of many study folders; unchanged files come from each folder's index
+    from src.input.SeriesIndex import index_directory
+    for folder in args.folders:
+        series_index = index_directory(folder, args.workers, args.rebuild, args.index_dir)
+        for series in sorted(series_index.series.values(), key=lambda series: series["number"] or 0):
+            spacing = f"{series['slice_spacing']:.3f}" if series['slice_spacing'] else '-'
+            print(f"  {series['uid']}  #{series['number']} {series['modality']} '{series['description'] or ''}' "
+                  f"{'x'.join(str(size) for size in series['dimensions'])} spacing {spacing} "
+                  f"{', '.join(series['flags']) or 'ok'}"
+                  + (f" ({series['missing_slices']} missing)" if series['missing_slices'] else ''))
+
+
+def bench(args):
+    from src.bench import run_benchmark
+    run_benchmark(args)
+
+
+def serve(args):
+    from src.server import RenderServer, parse_address
+    max_volumes = args.max_volumes
+    pipeline_options = {}
+    if args.memory_budget and args.preload:
+        # Planned from the first preloaded study; the LRU limit is how many volumes stay loaded
+        args.dicom_folder = args.preload[0]
+        estimate, _ = plan_memory_budget(args, max_volumes)
+        max_volumes = estimate.volumes
+        pipeline_options = dict(downsample=estimate.downsample, quantize=estimate.quantize)
+    server = RenderServer(max_volumes, args.size, pipeline_options)
+    for folder in args.preload:
+        server.get_pipeline(folder)
+    server.serve(parse_address(args.address), args.authkey, args.key_file)
+
+
+def import_report(argv):
+    # Same as python -X importtime, summarised: re-run the command in a child
+    # interpreter and list the slowest top level imports
+    import subprocess
+    command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__)] + argv
+    process = subprocess.run(command, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            print(line, file=sys.stderr)
+            continue
+        if 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Top level imports are not indented
+        if not name.startswith('  '):
+            imports.append((int(cumulative_us), int(self_us), name.strip()))
+    imports.sort(reverse=True)
+    total = sum(cumulative for cumulative, _, _ in imports)
+    print(f"\nImport time report: {total / 1e6:.3f}s in {len(imports)} top level imports")
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for cumulative, self_time, name in imports[:IMPORT_REPORT_TOP]:
+        print(f"{cumulative / 1e3:16.1f} {self_time / 1e3:10.1f}  {name}")
+    return process.returncode
+
+
+def add_pipeline_arguments(parser):
+    add_dicom_arguments(parser)
+    parser.add_argument('--size', type=int, nargs=2, default=[800, 800])
+    add_projection_arguments(parser, 'composite')
+
+
+def add_dicom_arguments(parser):
+    parser.add_argument('--dicom-folder', required=True)
+    parser.add_argument('--index', action='store_true',
+                        help='find the series through the folder\'s header index, the largest one if mixed')
+    parser.add_argument('--series-uid', default=None, help='SeriesInstanceUID to load from a mixed folder')
+    add_index_dir_argument(parser)
+
+
+def add_index_dir_argument(parser):
+    parser.add_argument('--index-dir', default=None,
+                        help='where header indexes and series links are kept, one sub folder per study; '
+                             'defaults to the study folder, or the user cache when it is read-only')
+
+
+def add_projection_arguments(parser, default, slab_normal=(0.0, 1.0, 0.0), choices=PROJECTION_CHOICES):
+    parser.add_argument('--projection', default=default, choices=choices,
+                        help='composite volume rendering or maximum / minimum / average intensity projection')
+    parser.add_argument('--slab-thickness', type=float, default=None, help='slab thickness in mm, whole volume if unset')
+    parser.add_argument('--slab-normal', type=float, nargs=3, default=slab_normal,
+                        help='slab orientation as a normal vector')
+
+
+def get_program_parameters(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION, epilog=EPILOGUE,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('--dicom-folder')
-    parser.add_argument('--export-nerf', action=argparse.BooleanOptionalAction)
-    args = parser.parse_args()
-    print("args", args)
-    return args
+    parser.add_argument('--importtime', action='store_true',
+                        help='run the command under -X importtime and print the slowest imports')
+    subparsers = parser.add_subparsers(dest='command', required=True)
 
+    view_parser = subparsers.add_parser('view', help='interactive volume rendering')
+    add_pipeline_arguments(view_parser)
+    view_parser.set_defaults(func=view)
 
-if __name__ == '__main__':
-    main()
+    export_parser = subparsers.add_parser('export', help='render a pose schedule as a NeRF dataset')
+    add_pipeline_arguments(export_parser)
+    export_parser.add_argument('--json-only', action='store_true',
+                               help='write transforms_*.json from the VTK poses and skip COLMAP')
+    export_parser.add_argument('--packed', action=argparse.BooleanOptionalAction, default=False,
+                               help='pack the exported frames into shard files instead of loose PNGs')
+    export_parser.add_argument('--colmap-mode', default='known_poses', choices=['known_poses', 'automatic'],
+                               help='triangulate with the exact VTK poses or run the full automatic reconstruction')
+    export_parser.add_argument('--colmap-executable', default=None,
+                               help='COLMAP executable, defaults to $COLMAP_EXECUTABLE or the bundled COLMAP.bat')
+    export_parser.add_argument('--scales', type=int, nargs='+', default=[1],
+                               help='downsampling factors to export, e.g. 1 2 4; every pose is rendered once')
+    export_parser.add_argument('--memory-budget', default=None,
+                               help='e.g. 8G for the render process plus COLMAP; quantize or downsample to fit')
+    export_parser.set_defaults(func=export)
+
+    colmap_parser = subparsers.add_parser('convert-colmap', help='convert a COLMAP text model to transforms.json')
+    colmap_parser.add_argument('--text', required=True, help='folder with cameras.txt and images.txt')
+    colmap_parser.add_argument('--images', required=True, help='folder with the images of the model')
+    colmap_parser.add_argument('--out', default='transforms.json')
+    colmap_parser.add_argument('--out-table', default='', help='binary pose table, defaults to --out with .npz')
+    colmap_parser.add_argument('--aabb-scale', default='1', choices=['1', '2', '4', '8', '16'])
+    colmap_parser.set_defaults(func=convert_colmap)
+
+    series_parser = subparsers.add_parser('series', help='render a time-resolved (4D) series with one pipeline')
+    phases = series_parser.add_mutually_exclusive_group(required=True)
+    phases.add_argument('--phase-folders', nargs='+', help='one DICOM folder per phase, in order')
+    phases.add_argument('--series-folder', help='folder with one DICOM sub folder per phase')
+    series_parser.add_argument('--size', type=int, nargs=2, default=[800, 800])
+    series_parser.add_argument('--output-dir', default=os.path.normpath('../output'))
+    series_parser.add_argument('--azimuth', type=float, default=None,
+                               help='render this one pose for every phase instead of the export schedule')
+    series_parser.add_argument('--elevation', type=float, default=None)
+    series_parser.add_argument('--json-only', action='store_true',
+                               help='write transforms_*.json from the VTK poses and skip COLMAP')
+    series_parser.add_argument('--colmap-mode', default='known_poses', choices=['known_poses', 'automatic'])
+    series_parser.add_argument('--colmap-executable', default=None)
+    series_parser.add_argument('--baseline', action='store_true',
+                               help='also time rebuilding the pipeline for every phase')
+    add_projection_arguments(series_parser, 'composite')
+    series_parser.set_defaults(func=series)
+
+    project_parser = subparsers.add_parser('project', help='numpy MIP / MinIP / average projection to a PNG')
+    add_dicom_arguments(project_parser)
+    project_parser.add_argument('--out', default='projection.png')
+    project_parser.add_argument('--axis', default='y', choices=['x', 'y', 'z'],
+                                help='projection axis when no --slab-normal is given')
+    add_projection_arguments(project_parser, 'mip', slab_normal=None, choices=INTENSITY_PROJECTION_CHOICES)
+    project_parser.set_defaults(func=project)
+
+    index_parser = subparsers.add_parser('index', help='index DICOM headers by series and flag incomplete ones')
+    index_parser.add_argument('folders', nargs='+', help='study folders, searched recursively')
+    index_parser.add_argument('--workers', type=int, default=None, help='header reading processes')
+    index_parser.add_argument('--rebuild', action='store_true', help='ignore the saved index and read every header')
+    add_index_dir_argument(index_parser)
+    index_parser.set_defaults(func=index)
+
+    bench_parser = subparsers.add_parser('bench', help='benchmarks')
+    bench_parser.add_argument('target', choices=['startup', 'projection', 'capture'])
+    bench_parser.add_argument('--repeat', type=int, default=5)
+    bench_parser.add_argument('--dicom-folder', default=None, help='defaults to the test data')
+    bench_parser.add_argument('--frames', type=int, default=36, help='frames rendered per case')
+    bench_parser.add_argument('--size', type=int, nargs=2, default=[800, 800])
+    bench_parser.set_defaults(func=bench)
+
+    serve_parser = subparsers.add_parser('serve', help='run the render server')
+    serve_parser.add_argument('--address', default='localhost:6060',
+                              help='host:port, or a unix socket / windows pipe path')
+    serve_parser.add_argument('--max-volumes', type=int, default=2)
+    serve_parser.add_argument('--size', type=int, nargs=2, default=[800, 800])
+    serve_parser.add_argument('--preload', nargs='*', default=[], help='DICOM folders to load before serving')
+    serve_parser.add_argument('--memory-budget', default=None,
+                              help='e.g. 8G; planned from the first --preload folder, may lower --max-volumes')
+    add_authkey_arguments(serve_parser)
+    serve_parser.set_defaults(func=serve)
 
+    return parser.parse_args(argv)
 
+
+def legacy_argv(argv):
+    # main.py --dicom-folder X [--export-nerf] [--export-packed] [--colmap-mode M]
+    # [--colmap-executable E] [--export-scales N ...] from before the subcommands, flags in any order
+    if any(arg in SUBCOMMANDS for arg in argv) \
+            or not any(arg.split('=', 1)[0] == '--dicom-folder' for arg in argv):
+        return argv
+    export = '--export-nerf' in argv
+    converted = []
+    dropping = False
+    for arg in argv:
+        if arg.startswith('--'):
+            name, separator, value = arg.partition('=')
+            dropping = not export and name in LEGACY_EXPORT_FLAGS
+            if dropping or name in ('--export-nerf', '--no-export-nerf'):
+                continue
+            converted.append(LEGACY_RENAMES.get(name, name) + separator + value)
+        elif not dropping:
+            converted.append(arg)
+    # --importtime is an option of the main parser and stays in front of the subcommand
+    options = [arg for arg in converted if arg == '--importtime']
+    return options + ['export' if export else 'view'] + [arg for arg in converted if arg != '--importtime']
+
+
+def main(argv=None):
+    argv = legacy_argv(sys.argv[1:] if argv is None else argv)
+    if '--importtime' in argv and 'importtime' not in sys._xoptions:
+        return import_report([arg for arg in argv if arg != '--importtime'])
+    args = get_program_parameters(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
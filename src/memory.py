@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+MB = 1024 ** 2
+GB = 1024 ** 3
+# Interpreter with vtk, numpy and cv2 imported and an OpenGL context, before any data
+BASE_BYTES = 400 * MB
+# Staging copy the GPU mapper makes of the volume while uploading the texture
+MAPPER_COPIES = 1
+# Render window, vtkWindowToImageFilter output and the PNG / numpy copy of a frame
+FRAMEBUFFER_COPIES = 3
+# float32 RGBA working buffers of the multi-scale pyramid
+PYRAMID_BYTES_PER_PIXEL = 2 * 4 * 4
+MAX_DOWNSAMPLE = 8
+# COLMAP subprocess during known-pose triangulation: the process itself plus the SIFT
+# scale space of the frame being extracted (rough, CPU extraction)
+COLMAP_BASE_BYTES = 1 * GB
+COLMAP_BYTES_PER_PIXEL = 64
+SAMPLE_INTERVAL = 0.05
+DICOM_EXTENSIONS = ('.dcm', '.dicom', '')
+
+
+def parse_size(text):
+    # "8G", "512M", "1073741824"
+    text = str(text).strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': MB, 'G': GB, 'T': 1024 * GB}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    return f"{size / GB:.2f}G" if size >= GB else f"{size / MB:.0f}M"
+
+
+class VolumeHeader(object):
+    def __init__(self, columns, rows, slices, bytes_per_voxel):
+        self.columns = columns
+        self.rows = rows
+        self.slices = slices
+        self.bytes_per_voxel = bytes_per_voxel
+
+    @property
+    def voxels(self):
+        return self.columns * self.rows * self.slices
+
+
+def read_volume_header(dicom_folder):
+    # Dimensions and voxel size from one header (pixel data is not read) and the file count
+    import pydicom
+    files = sorted(name for name in os.listdir(dicom_folder)
+                   if os.path.isfile(os.path.join(dicom_folder, name))
+                   and os.path.splitext(name)[1].lower() in DICOM_EXTENSIONS)
+    if not files:
+        raise ValueError(f"No DICOM files in {dicom_folder}")
+    header = pydicom.dcmread(os.path.join(dicom_folder, files[0]), stop_before_pixels=True)
+    frames = int(getattr(header, 'NumberOfFrames', 1) or 1)
+    bytes_per_voxel = int(header.BitsAllocated) // 8 * int(getattr(header, 'SamplesPerPixel', 1))
+    return VolumeHeader(int(header.Columns), int(header.Rows), len(files) * frames, bytes_per_voxel)
+
+
+class MemoryEstimate(object):
+    # Peak bytes of one render process holding `volumes` loaded pipelines (one for an export,
+    # the LRU limit of the render server). While loading, the raw reader output and its
+    # reduced copy coexist; while rendering, the reduced volumes, the mapper's staging copies
+    # and the frame buffers do. COLMAP runs after rendering in its own process, so it adds its
+    # own footprint to the render process' but never holds the volume.
+    def __init__(self, header, size, volumes=1, downsample=1, quantize=False, scales=(1,), colmap=False):
+        self.header = header
+        self.size = tuple(size)
+        self.volumes = volumes
+        self.downsample = downsample
+        self.quantize = quantize
+        self.colmap = colmap
+        self.raw_bytes = header.voxels * header.bytes_per_voxel
+        reduced_voxels = header.voxels // (downsample ** 3)
+        self.volume_bytes = reduced_voxels * (1 if quantize else header.bytes_per_voxel)
+        reduced = downsample > 1 or quantize
+        pixels = self.size[0] * self.size[1]
+        self.framebuffer_bytes = pixels * 4 * FRAMEBUFFER_COPIES
+        if len(set(scales)) > 1:
+            self.framebuffer_bytes += pixels * PYRAMID_BYTES_PER_PIXEL
+        self.load_bytes = BASE_BYTES + self.raw_bytes + (self.volume_bytes if reduced else 0) \
+            + (volumes - 1) * self.volume_bytes * (1 + MAPPER_COPIES)
+        self.render_bytes = BASE_BYTES + volumes * (self.volume_bytes * (1 + MAPPER_COPIES) + self.framebuffer_bytes)
+        self.process_bytes = max(self.load_bytes, self.render_bytes)
+        self.colmap_bytes = COLMAP_BASE_BYTES + pixels * COLMAP_BYTES_PER_PIXEL if colmap else 0
+        self.total_bytes = max(self.load_bytes, self.render_bytes + self.colmap_bytes)
+
+    def as_dict(self):
+        return {
+            "dimensions": [self.header.columns, self.header.rows, self.header.slices],
+            "bytes_per_voxel": self.header.bytes_per_voxel,
+            "size": list(self.size),
+            "volumes": self.volumes,
+            "downsample": self.downsample,
+            "quantize": self.quantize,
+            "colmap": self.colmap,
+            "raw_bytes": self.raw_bytes,
+            "volume_bytes": self.volume_bytes,
+            "framebuffer_bytes": self.framebuffer_bytes,
+            "load_bytes": self.load_bytes,
+            "render_bytes": self.render_bytes,
+            "process_bytes": self.process_bytes,
+            "colmap_bytes": self.colmap_bytes,
+            "total_bytes": self.total_bytes
+        }
+
+
+def plan_memory(header, budget, size, volumes=1, scales=(1,), colmap=False):
+    # Cheapest reductions first: fewer loaded volumes (render server only), then 8 bit voxels,
+    # then downsampling. Returns the estimate of the chosen settings and whether it fits the budget.
+    estimate = MemoryEstimate(header, size, volumes, scales=scales, colmap=colmap)
+    while estimate.total_bytes > budget and estimate.volumes > 1:
+        estimate = MemoryEstimate(header, size, estimate.volumes - 1, scales=scales, colmap=colmap)
+    if estimate.total_bytes > budget and header.bytes_per_voxel > 1:
+        estimate = MemoryEstimate(header, size, estimate.volumes, quantize=True, scales=scales, colmap=colmap)
+    downsample = 1
+    while estimate.total_bytes > budget and downsample < MAX_DOWNSAMPLE:
+        downsample += 1
+        estimate = MemoryEstimate(header, size, estimate.volumes, downsample, estimate.quantize, scales, colmap)
+    fits = estimate.total_bytes <= budget
+    if not fits:
+        print(f"Warning: {format_size(estimate.total_bytes)} needed even after reductions, "
+              f"budget is {format_size(budget)}")
+    return estimate, fits
+
+
+def current_rss():
+    # psutil when available, /proc on Linux, otherwise the process high water mark
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    import resource
+    import sys
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class MemoryTracker(object):
+    # Peak RSS per stage, sampled by a background thread so short spikes inside
+    # VTK calls are seen too
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stages = []
+        self._peak = 0
+        self._lock = threading.Lock()
+
+    def _sample(self, stop):
+        while not stop.wait(self.interval):
+            rss = current_rss()
+            with self._lock:
+                self._peak = max(self._peak, rss)
+
+    @contextmanager
+    def stage(self, name):
+        start_rss = current_rss()
+        with self._lock:
+            self._peak = start_rss
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(stop,), daemon=True)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            end_rss = current_rss()
+            self.stages.append({
+                "name": name,
+                "seconds": time.perf_counter() - start,
+                "start_rss": start_rss,
+                "end_rss": end_rss,
+                "peak_rss": max(self._peak, end_rss)
+            })
+
+    @property
+    def peak_rss(self):
+        return max((stage["peak_rss"] for stage in self.stages), default=0)
+
+
+def write_run_summary(path, tracker, estimate=None, budget=None, fits=None):
+    summary = {
+        "budget": budget,
+        "fits": fits,
+        "estimate": estimate.as_dict() if estimate is not None else None,
+        "stages": tracker.stages,
+        "peak_rss": tracker.peak_rss
+    }
+    print(f"{'stage':<12} {'seconds':>8} {'peak RSS':>10}")
+    for stage in tracker.stages:
+        print(f"{stage['name']:<12} {stage['seconds']:8.2f} {format_size(stage['peak_rss']):>10}")
+    if estimate is not None:
+        # Only this process is measured, the COLMAP subprocess is not part of its RSS
+        print(f"estimated {format_size(estimate.process_bytes)} for this process "
+              f"(+ COLMAP {format_size(estimate.colmap_bytes)} = {format_size(estimate.total_bytes)}), "
+              f"measured peak {format_size(tracker.peak_rss)}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as outfile:
+        outfile.write(json.dumps(summary))
+    return summary
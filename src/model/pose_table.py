@@ -0,0 +1,202 @@
+import os
+import json
+import pathlib
+import posixpath
+import numpy as np
+
+
+SPLITS = ['train', 'test', 'val']
+POSE_TABLE_EXTENSION = '.npz'
+_COLUMN_PREFIX = 'column_'
+_INITIAL_CAPACITY = 64
+
+
+def _split_codes(splits, size):
+    if isinstance(splits, str):
+        return np.full(size, SPLITS.index(splits), dtype=np.uint8)
+    splits = np.asarray(splits)
+    if splits.dtype.kind in ('U', 'S', 'O'):
+        return np.array([SPLITS.index(str(split)) for split in splits], dtype=np.uint8)
+    return splits.astype(np.uint8)
+
+
+class PoseTable(object):
+    # Camera poses of a dataset as contiguous arrays:
+    #   matrices (N, 4, 4) float32 camera-to-world transforms
+    #   paths    (N,) image paths as they appear in transforms_*.json
+    #   splits   (N,) uint8 index into SPLITS
+    #   columns  optional (N,) float32 per-frame values, e.g. sharpness
+    # plus a meta dict with the shared intrinsics (camera_angle_x, fl_x, w, h...).
+    # The JSON layout is produced from it only when writing transforms_*.json.
+    def __init__(self, matrices=None, paths=None, splits='train', columns=None, meta=None):
+        if matrices is None:
+            matrices = np.zeros((0, 4, 4), dtype=np.float32)
+        self._matrices = np.ascontiguousarray(matrices, dtype=np.float32).reshape(-1, 4, 4)
+        self._size = self._matrices.shape[0]
+        self._paths = np.empty(self._size, dtype=object)
+        if paths is not None:
+            self._paths[:] = [str(path) for path in paths]
+        self._splits = _split_codes(splits, self._size)
+        self._columns = {name: np.asarray(values, dtype=np.float32) for name, values in (columns or {}).items()}
+        self.meta = dict(meta or {})
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def matrices(self):
+        return self._matrices[:self._size]
+
+    @property
+    def paths(self):
+        return self._paths[:self._size]
+
+    @property
+    def splits(self):
+        return self._splits[:self._size]
+
+    @property
+    def split_labels(self):
+        return np.array(SPLITS)[self.splits]
+
+    @property
+    def column_names(self):
+        return list(self._columns.keys())
+
+    def column(self, name):
+        return self._columns[name][:self._size]
+
+    def _reserve(self, size):
+        capacity = self._matrices.shape[0]
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, _INITIAL_CAPACITY)
+        matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+        matrices[:self._size] = self.matrices
+        paths = np.empty(capacity, dtype=object)
+        paths[:self._size] = self.paths
+        splits = np.zeros(capacity, dtype=np.uint8)
+        splits[:self._size] = self.splits
+        for name, values in self._columns.items():
+            column = np.zeros(capacity, dtype=np.float32)
+            column[:self._size] = values[:self._size]
+            self._columns[name] = column
+        self._matrices, self._paths, self._splits = matrices, paths, splits
+
+    def append(self, matrix, path, split='train', **columns):
+        self._reserve(self._size + 1)
+        idx = self._size
+        self._matrices[idx] = matrix
+        self._paths[idx] = str(path)
+        self._splits[idx] = SPLITS.index(split)
+        for name, value in columns.items():
+            if name not in self._columns:
+                self._columns[name] = np.zeros(self._matrices.shape[0], dtype=np.float32)
+            self._columns[name][idx] = value
+        self._size += 1
+        return idx
+
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        return PoseTable(self.matrices[indices], self.paths[indices], self.splits[indices],
+                         {name: self.column(name)[indices] for name in self._columns}, self.meta)
+
+    def select(self, split):
+        return self.take(np.flatnonzero(self.splits == SPLITS.index(split)))
+
+    def find_paths(self, paths):
+        # Indices of the given paths in the table, in the order they are given; -1 if missing
+        lookup = {path: idx for idx, path in enumerate(self.paths)}
+        return np.array([lookup.get(path, -1) for path in paths], dtype=np.int64)
+
+    def set_split(self, split, indices=None):
+        if indices is None:
+            indices = slice(0, self._size)
+        self._splits[indices] = SPLITS.index(split)
+
+    def set_paths(self, paths, indices=None):
+        if indices is None:
+            indices = slice(0, self._size)
+        self._paths[indices] = list(paths)
+
+    def make_paths_relative(self, dataset_dir, keep_ext=True):
+        # ./..\\output\\train/r_98.png
+        # to ./train/r_98
+        def fix(path):
+            path = os.path.relpath(path, dataset_dir)
+            if not keep_ext:
+                path = os.path.splitext(path)[0]
+            return posixpath.join('./', pathlib.Path(path).as_posix())
+        self._paths[:self._size] = np.frompyfunc(fix, 1, 1)(self.paths)
+
+    @staticmethod
+    def concatenate(tables, meta=None):
+        tables = [table for table in tables if len(table) > 0]
+        if not tables:
+            return PoseTable(meta=meta)
+        names = set(tables[0].column_names)
+        for table in tables[1:]:
+            names &= set(table.column_names)
+        return PoseTable(np.concatenate([table.matrices for table in tables]),
+                         np.concatenate([table.paths for table in tables]),
+                         np.concatenate([table.splits for table in tables]),
+                         {name: np.concatenate([table.column(name) for table in tables]) for name in names},
+                         tables[0].meta if meta is None else meta)
+
+    def save(self, path):
+        arrays = {
+            "matrices": self.matrices,
+            "paths": self.paths.astype(str),
+            "splits": self.splits,
+            "meta": np.array(json.dumps(self.meta))
+        }
+        for name in self._columns:
+            arrays[_COLUMN_PREFIX + name] = self.column(name)
+        with open(path, 'wb') as outfile:
+            np.savez(outfile, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            columns = {key[len(_COLUMN_PREFIX):]: data[key] for key in data.files if key.startswith(_COLUMN_PREFIX)}
+            return cls(data["matrices"], data["paths"], data["splits"], columns, json.loads(str(data["meta"])))
+
+    def to_json(self, split=None):
+        table = self if split is None else self.select(split)
+        json_out = dict(table.meta)
+        names = table.column_names
+        columns = [table.column(name).tolist() for name in names]
+        json_out["frames"] = []
+        for idx, (path, matrix) in enumerate(zip(table.paths, table.matrices.tolist())):
+            frame = {"file_path": path}
+            for name, values in zip(names, columns):
+                frame[name] = values[idx]
+            frame["transform_matrix"] = matrix
+            json_out["frames"].append(frame)
+        return json_out
+
+    def write_json(self, json_path, split=None):
+        with open(json_path, 'w') as outfile:
+            outfile.write(json.dumps(self.to_json(split)))
+
+    def write_transforms(self, output_dir, splits=SPLITS):
+        for split in splits:
+            self.write_json(os.path.join(output_dir, f'transforms_{split}.json'), split)
+
+    @classmethod
+    def from_json(cls, json_path, split='train'):
+        with open(json_path) as file:
+            data = json.load(file)
+        frames = data.pop('frames')
+        names = [key for key, value in (frames[0].items() if frames else [])
+                 if key not in ('file_path', 'transform_matrix') and isinstance(value, (int, float))]
+        return cls(np.array([frame['transform_matrix'] for frame in frames], dtype=np.float32),
+                   [frame['file_path'] for frame in frames],
+                   split,
+                   {name: [frame[name] for frame in frames] for name in names},
+                   data)
+
+
+def pose_table_path(json_path):
+    # Binary sidecar that sits next to a transforms json, e.g. transforms_train.npz
+    return os.path.splitext(json_path)[0] + POSE_TABLE_EXTENSION
@@ -0,0 +1,296 @@
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+import vtkmodules.vtkInteractionStyle
+# noinspection PyUnresolvedReferences
+import vtkmodules.vtkRenderingOpenGL2
+# noinspection PyUnresolvedReferences
+import vtkmodules.vtkRenderingVolumeOpenGL2
+from vtkmodules.vtkCommonColor import vtkNamedColors
+from vtkmodules.vtkCommonDataModel import vtkImageData, vtkPiecewiseFunction, vtkPlane
+from vtkmodules.vtkImagingCore import vtkImageShiftScale, vtkImageShrink3D
+from vtkmodules.vtkIOImage import (
+    vtkDICOMImageReader,
+)
+from vtkmodules.vtkRenderingCore import (
+    vtkColorTransferFunction,
+    vtkRenderWindow,
+    vtkRenderer,
+    vtkVolume,
+    vtkVolumeProperty,
+)
+from vtkmodules.vtkRenderingVolume import vtkGPUVolumeRayCastMapper
+
+from src.model.colormap.Standard import STANDARD
+from src.model.colormap.toRGBPoints import to_rgb_points
+from src.projection import MODE_COMPOSITE, MODE_MIP, MODE_MINIP, MODE_AVERAGE
+
+
+DEFAULT_SIZE = (800, 800)
+DEFAULT_WINDOW_NAME = 'MedicalDemo4'
+
+
+class VolumePipeline(object):
+    # Reader -> mapper -> volume -> renderer -> window, kept together so the
+    # pipeline can be reused for many renders once the volume is loaded
+    def __init__(self, reader, volume_mapper, volume, renderer, render_window):
+        self.reader = reader
+        self.volume_mapper = volume_mapper
+        self.volume = volume
+        self.renderer = renderer
+        self.render_window = render_window
+        self.camera = renderer.GetActiveCamera()
+        self.image_data = volume_mapper.GetInput()
+        self._initial_camera = (self.camera.GetPosition(), self.camera.GetFocalPoint(), self.camera.GetViewUp())
+
+    def reset_camera(self):
+        position, focal_point, view_up = self._initial_camera
+        self.camera.SetPosition(*position)
+        self.camera.SetFocalPoint(*focal_point)
+        self.camera.SetViewUp(*view_up)
+        self.camera.OrthogonalizeViewUp()
+
+    def apply_pose(self, pose):
+        # A pose is either relative to the default view of the volume
+        #   {"azimuth": 30, "elevation": 15}
+        # or an explicit camera
+        #   {"position": [x, y, z], "focal_point": [x, y, z], "view_up": [x, y, z]}
+        camera = self.camera
+        self.reset_camera()
+        if 'position' in pose:
+            camera.SetPosition(*pose['position'])
+            if 'focal_point' in pose:
+                camera.SetFocalPoint(*pose['focal_point'])
+            if 'view_up' in pose:
+                camera.SetViewUp(*pose['view_up'])
+            self.renderer.ResetCameraClippingRange()
+        camera.Azimuth(pose.get('azimuth', 0.0))
+        camera.Elevation(pose.get('elevation', 0.0))
+        camera.OrthogonalizeViewUp()
+
+    def set_projection_mode(self, mode, slab_thickness=None, slab_normal=(0, 1, 0), slab_center=None):
+        set_projection_mode(self.volume, mode, slab_thickness, slab_normal, slab_center)
+
+    def release(self):
+        self.render_window.Finalize()
+
+
+def set_projection_mode(volume, mode, slab_thickness=None, slab_normal=(0, 1, 0), slab_center=None):
+    # Composite is the shaded, gradient opacity rendering of build_pipeline. MIP, MinIP and
+    # average need neither shading nor gradients, which is where most of their speed comes from.
+    # A slab is the part of the volume between two clipping planes slab_thickness (mm) apart,
+    # centred on slab_center (the volume center by default) and perpendicular to slab_normal.
+    volume_mapper = volume.GetMapper()
+    volume_property = volume.GetProperty()
+    if mode == MODE_COMPOSITE:
+        volume_mapper.SetBlendModeToComposite()
+    elif mode == MODE_MIP:
+        volume_mapper.SetBlendModeToMaximumIntensity()
+    elif mode == MODE_MINIP:
+        volume_mapper.SetBlendModeToMinimumIntensity()
+    elif mode == MODE_AVERAGE:
+        volume_mapper.SetBlendModeToAverageIntensity()
+        volume_mapper.SetAverageIPScalarRange(*volume_mapper.GetInput().GetScalarRange())
+    else:
+        raise ValueError(f"Unknown projection mode: {mode}")
+    composite = mode == MODE_COMPOSITE
+    volume_property.SetShade(composite)
+    volume_property.SetDisableGradientOpacity(not composite)
+
+    volume_mapper.RemoveAllClippingPlanes()
+    if slab_thickness is not None:
+        normal = np.asarray(slab_normal, dtype=np.float64)
+        normal = normal / np.linalg.norm(normal)
+        center = np.asarray(volume.GetCenter() if slab_center is None else slab_center)
+        for side in (-1, 1):
+            # Clipping planes keep the half space their normal points into
+            plane = vtkPlane()
+            plane.SetOrigin(*(center + side * normal * slab_thickness / 2))
+            plane.SetNormal(*(-side * normal))
+            volume_mapper.AddClippingPlane(plane)
+
+
+def reduce_volume(reader, downsample=1, quantize=False):
+    # Downsampled (block average) and/or 8 bit copy of the reader output, detached from the
+    # reader so the full resolution volume is freed once the reader goes away.
+    # Returns the image and the (shift, scale) that maps original values onto it.
+    reader.Update()
+    image = reader.GetOutput()
+    shift, scale = 0.0, 1.0
+    if downsample > 1:
+        shrink = vtkImageShrink3D()
+        shrink.SetInputData(image)
+        shrink.SetShrinkFactors(downsample, downsample, downsample)
+        shrink.AveragingOn()
+        shrink.Update()
+        image = shrink.GetOutput()
+    if quantize:
+        low, high = image.GetScalarRange()
+        shift = -low
+        scale = 255.0 / (high - low) if high > low else 1.0
+        shift_scale = vtkImageShiftScale()
+        shift_scale.SetInputData(image)
+        shift_scale.SetShift(shift)
+        shift_scale.SetScale(scale)
+        shift_scale.SetOutputScalarTypeToUnsignedChar()
+        shift_scale.ClampOverflowOn()
+        shift_scale.Update()
+        image = shift_scale.GetOutput()
+    reduced = vtkImageData()
+    reduced.ShallowCopy(image)
+    return reduced, shift, scale
+
+
+def build_pipeline(dicom_folder, size=DEFAULT_SIZE, window_name=DEFAULT_WINDOW_NAME, offscreen=False,
+                   input_data=None, downsample=1, quantize=False):
+    # input_data (vtkImageData) replaces the DICOM reader, e.g. for the 4D series
+    # whose phases are swapped into one image. downsample and quantize trade quality
+    # for memory, see src/memory.py
+    colors = vtkNamedColors()
+
+    colors.SetColor('BkgColor', [255, 255, 255, 0])
+
+    # Create the renderer, the render window, and the interactor. The renderer
+    # draws into the render window, the interactor enables mouse- and
+    # keyboard-based interaction with the scene.
+    ren = vtkRenderer()
+    ren_win = vtkRenderWindow()
+    ren_win.AddRenderer(ren)
+
+
+    # The following reader is used to read a series of 2D slices (images)
+    # that compose the volume. The slice dimensions are set, and the
+    # pixel spacing. The data Endianness must also be specified. The reader
+    # uses the FilePrefix in combination with the slice number to construct
+    # filenames using the format FilePrefix.%d. (In this case the FilePrefix
+    # is the root name of the file: quarter.)
+    # reader = vtkMetaImageReader()
+    # reader.SetFileName(file_name)
+    reader = None
+    # The transfer functions below are in the original units (HU), shift and scale
+    # map them onto a quantized volume
+    shift, scale = 0.0, 1.0
+    if input_data is None:
+        reader = vtkDICOMImageReader()
+        reader.SetDirectoryName(dicom_folder)
+        if downsample > 1 or quantize:
+            input_data, shift, scale = reduce_volume(reader, downsample, quantize)
+            reader = None
+
+    # The volume will be displayed by ray-cast alpha compositing.
+    # A ray-cast mapper is needed to do the ray-casting.
+    volume_mapper = vtkGPUVolumeRayCastMapper()
+    if reader is not None:
+        volume_mapper.SetInputConnection(reader.GetOutputPort())
+    else:
+        volume_mapper.SetInputData(input_data)
+
+    # The color transfer function maps voxel intensities to colors.
+    # It is modality-specific, and often anatomy-specific as well.
+    # The goal is to one color for flesh (between 500 and 1000)
+    # and another color for bone (1150 and over).
+    rgb_points = to_rgb_points(STANDARD)
+    volume_color = vtkColorTransferFunction()
+    # volume_color.AddRGBPoint(0, 0.0, 0.0, 0.0)
+    # volume_color.AddRGBPoint(500, 240.0 / 255.0, 184.0 / 255.0, 160.0 / 255.0)
+    # volume_color.AddRGBPoint(1000, 240.0 / 255.0, 184.0 / 255.0, 160.0 / 255.0)
+    # volume_color.AddRGBPoint(1150, 1.0, 1.0, 240.0 / 255.0)  # Ivory
+    for rgb_point in rgb_points:
+        volume_color.AddRGBPoint((rgb_point[0] + shift) * scale, rgb_point[1], rgb_point[2], rgb_point[3])
+
+    # The opacity transfer function is used to control the opacity
+    # of different tissue types.
+    volume_scalar_opacity = vtkPiecewiseFunction()
+    volume_scalar_opacity.AddPoint((0 + shift) * scale, 0.00)
+    volume_scalar_opacity.AddPoint((500 + shift) * scale, 0.15)
+    volume_scalar_opacity.AddPoint((800 + shift) * scale, 1.00)
+    # volume_scalar_opacity.AddPoint(1150, 1.00)
+
+    # The gradient opacity function is used to decrease the opacity
+    # in the 'flat' regions of the volume while maintaining the opacity
+    # at the boundaries between tissue types.  The gradient is measured
+    # as the amount by which the intensity changes over unit distance.
+    # For most medical data, the unit distance is 1mm.
+    volume_gradient_opacity = vtkPiecewiseFunction()
+    volume_gradient_opacity.AddPoint(0, 0.0)
+    volume_gradient_opacity.AddPoint(90 * scale, 0.5)
+    volume_gradient_opacity.AddPoint(100 * scale, 1.0)
+
+    # The VolumeProperty attaches the color and opacity functions to the
+    # volume, and sets other volume properties.  The interpolation should
+    # be set to linear to do a high-quality rendering.  The ShadeOn option
+    # turns on directional lighting, which will usually enhance the
+    # appearance of the volume and make it look more '3D'.  However,
+    # the quality of the shading depends on how accurately the gradient
+    # of the volume can be calculated, and for noisy data the gradient
+    # estimation will be very poor.  The impact of the shading can be
+    # decreased by increasing the Ambient coefficient while decreasing
+    # the Diffuse and Specular coefficient.  To increase the impact
+    # of shading, decrease the Ambient and increase the Diffuse and Specular.
+    volume_property = vtkVolumeProperty()
+    volume_property.SetColor(volume_color)
+    volume_property.SetScalarOpacity(volume_scalar_opacity)
+    volume_property.SetGradientOpacity(volume_gradient_opacity)
+    volume_property.SetInterpolationTypeToLinear()
+    volume_property.ShadeOn()
+    volume_property.SetAmbient(0.4)
+    volume_property.SetDiffuse(1.0)
+    volume_property.SetSpecular(0.4)
+
+    # Extra paraneeters for volume mapper
+    volume_mapper.SetBlendModeToComposite()
+    volume_mapper.SetSampleDistance(0.5)
+    volume_mapper.AutoAdjustSampleDistancesOff()
+    volume_mapper.SetUseJittering(True)
+    volume_mapper.UseJitteringOn()
+
+    # The vtkVolume is a vtkProp3D (like a vtkActor) and controls the position
+    # and orientation of the volume in world coordinates.
+    volume = vtkVolume()
+    volume.SetMapper(volume_mapper)
+    volume.SetProperty(volume_property)
+
+    # Finally, add the volume to the renderer
+    ren.AddViewProp(volume)
+
+    # Set up an initial view of the volume.  The focal point will be the
+    # center of the volume, and the camera position will be 400mm to the
+    # patient's left (which is our right).
+    view_angle = 40.0
+    camera = ren.GetActiveCamera()
+    c = volume.GetCenter()
+    camera.SetViewUp(0, 0, -1)
+    camera.SetFocalPoint(c[0], c[1], c[2])
+    camera.SetViewAngle(view_angle)
+
+    # Position camera so that the volume fit the camera FOV
+    # angle = 2*atan((h/2)/d)
+    # d = (h/2)/tan(angle/2)
+    # vtk's camera Y-axis is the axis that points towards the scene
+    pixel_spacing = reader.GetPixelSpacing() if reader is not None else input_data.GetSpacing()
+    max_x = (volume.GetMaxXBound() + 1)
+    max_y = (volume.GetMaxYBound() + 1)
+    max_z = (volume.GetMaxZBound() + 1)
+    max_dim = np.max([max_x, max_y, max_z])
+    offset = (max_z / 2) / np.tan(np.radians(view_angle / 2)) + (max_x / 2)
+    camera.SetPosition(c[0], c[1] - offset, c[2])
+    camera.SetClippingRange(0.1, offset + max_dim)
+    # camera.SetClippingRange(2.0, 6.0)
+    print("pixel spacing", pixel_spacing)
+    print("volume", max_dim, offset)
+
+    # camera.Azimuth(30.0)
+    # camera.Elevation(30.0)
+
+    # Set a background color for the renderer
+    ren.SetBackground(colors.GetColor3d('BkgColor'))
+
+    # Increase the size of the render window
+    ren_win.SetSize(*size)
+    ren_win.SetWindowName(window_name)
+    ren_win.SetAlphaBitPlanes(1)
+
+    if offscreen:
+        ren_win.SetOffScreenRendering(1)
+
+    return VolumePipeline(reader, volume_mapper, volume, ren, ren_win)
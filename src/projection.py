@@ -0,0 +1,146 @@
+import numpy as np
+
+
+MODE_COMPOSITE = 'composite'
+MODE_MIP = 'mip'
+MODE_MINIP = 'minip'
+MODE_AVERAGE = 'average'
+MODES = [MODE_COMPOSITE, MODE_MIP, MODE_MINIP, MODE_AVERAGE]
+PROJECTION_MODES = [MODE_MIP, MODE_MINIP, MODE_AVERAGE]
+
+
+def volume_from_image(image_data):
+    # vtkImageData -> (Z, Y, X) numpy view of the scalars and the (x, y, z) spacing
+    from vtkmodules.util.numpy_support import vtk_to_numpy
+    x, y, z = image_data.GetDimensions()
+    volume = vtk_to_numpy(image_data.GetPointData().GetScalars()).reshape(z, y, x)
+    return volume, image_data.GetSpacing()
+
+
+def _check_mode(mode):
+    if mode not in PROJECTION_MODES:
+        raise ValueError(f"Unknown projection mode: {mode}, expected one of {PROJECTION_MODES}")
+
+
+def project_axis(volume, mode, axis=0, start=0, thickness=None):
+    # Axis aligned slab of a (Z, Y, X) volume, reduced along one array axis
+    _check_mode(mode)
+    stop = None if thickness is None else start + thickness
+    index = [slice(None)] * 3
+    index[axis] = slice(start, stop)
+    slab = volume[tuple(index)]
+    if mode == MODE_MIP:
+        return slab.max(axis=axis).astype(np.float32)
+    if mode == MODE_MINIP:
+        return slab.min(axis=axis).astype(np.float32)
+    return slab.mean(axis=axis, dtype=np.float32)
+
+
+def _sample_trilinear(volume, points):
+    # points (..., 3) in (x, y, z) voxel index coordinates; returns values and a mask of in-volume samples
+    shape = np.array(volume.shape[::-1])
+    valid = np.all((points >= 0) & (points <= shape - 1), axis=-1)
+    points = np.clip(points, 0, shape - 1)
+    i0 = np.floor(points).astype(np.int64)
+    i1 = np.minimum(i0 + 1, shape - 1)
+    f = (points - i0).astype(np.float32)
+    x0, y0, z0 = i0[..., 0], i0[..., 1], i0[..., 2]
+    x1, y1, z1 = i1[..., 0], i1[..., 1], i1[..., 2]
+    fx, fy, fz = f[..., 0], f[..., 1], f[..., 2]
+    c00 = volume[z0, y0, x0] * (1 - fx) + volume[z0, y0, x1] * fx
+    c01 = volume[z1, y0, x0] * (1 - fx) + volume[z1, y0, x1] * fx
+    c10 = volume[z0, y1, x0] * (1 - fx) + volume[z0, y1, x1] * fx
+    c11 = volume[z1, y1, x0] * (1 - fx) + volume[z1, y1, x1] * fx
+    c0 = c00 * (1 - fy) + c10 * fy
+    c1 = c01 * (1 - fy) + c11 * fy
+    return c0 * (1 - fz) + c1 * fz, valid
+
+
+# Row and column directions of project_axis' output for each (x, y, z) projection axis:
+# the remaining axes in (z, y, x) array order
+AXIS_IMAGE_DIRECTIONS = {
+    0: ([0.0, 0.0, 1.0], [0.0, 1.0, 0.0]),
+    1: ([0.0, 0.0, 1.0], [1.0, 0.0, 0.0]),
+    2: ([0.0, 1.0, 0.0], [1.0, 0.0, 0.0]),
+}
+
+
+def _orthogonal(vector, *basis):
+    vector = np.asarray(vector, dtype=np.float64)
+    for axis in basis:
+        vector = vector - np.dot(vector, axis) * axis
+    return vector / np.linalg.norm(vector)
+
+
+def slab_basis(normal, up=None):
+    # normal and the image's column (u) and row (v) directions. Rows and columns follow the
+    # volume axes project_axis keeps for the normal's dominant axis, so an axis aligned normal
+    # gives the same image as project_axis; up, if given, overrides the row direction.
+    normal = np.asarray(normal, dtype=np.float64)
+    normal = normal / np.linalg.norm(normal)
+    row, column = AXIS_IMAGE_DIRECTIONS[int(np.argmax(np.abs(normal)))]
+    if up is not None:
+        v = _orthogonal(up, normal)
+        u = np.cross(v, normal)
+        # keep the column direction of the dominant axis
+        if np.dot(u, column) < 0:
+            u = -u
+        return normal, u, v
+    u = _orthogonal(column, normal)
+    v = _orthogonal(row, normal, u)
+    return normal, u, v
+
+
+def project_oblique(volume, mode, normal, center=None, thickness=None, spacing=(1.0, 1.0, 1.0),
+                    size=None, step=1.0, up=None):
+    # Slab of any orientation. normal, center and thickness are in world units (mm) with the
+    # volume origin at 0. The image plane is perpendicular to normal and covers the whole
+    # volume; each step along the normal is one vectorized trilinear gather over the plane,
+    # reduced into a running max / min / sum so memory stays at one plane.
+    _check_mode(mode)
+    spacing = np.asarray(spacing, dtype=np.float64)
+    extent = (np.array(volume.shape[::-1]) - 1) * spacing
+    center = extent / 2 if center is None else np.asarray(center, dtype=np.float64)
+    radius = np.linalg.norm(extent) / 2
+    normal, u, v = slab_basis(normal, up)
+    if size is None:
+        size = int(np.ceil(2 * radius / spacing.min()))
+    pitch = 2 * radius / size
+    coords = (np.arange(size) - size / 2 + 0.5) * pitch
+    # rows along +v and columns along +u, first row and column at the low end like project_axis
+    plane = center + coords[:, None, None] * v + coords[None, :, None] * u
+    if thickness is None:
+        thickness = 2 * radius
+    offsets = np.arange(-thickness / 2, thickness / 2 + 1e-6, step * spacing.min())
+
+    if mode == MODE_MIP:
+        result = np.full((size, size), -np.inf, dtype=np.float32)
+    elif mode == MODE_MINIP:
+        result = np.full((size, size), np.inf, dtype=np.float32)
+    else:
+        result = np.zeros((size, size), dtype=np.float32)
+    count = np.zeros((size, size), dtype=np.int32)
+    for offset in offsets:
+        values, valid = _sample_trilinear(volume, (plane + offset * normal) / spacing)
+        if mode == MODE_MIP:
+            np.maximum(result, np.where(valid, values, -np.inf), out=result)
+        elif mode == MODE_MINIP:
+            np.minimum(result, np.where(valid, values, np.inf), out=result)
+        else:
+            result += np.where(valid, values, 0)
+        count += valid
+    if mode == MODE_AVERAGE:
+        result = np.divide(result, count, out=np.zeros_like(result), where=count > 0)
+    result[count == 0] = np.nan
+    return result
+
+
+def projection_to_rgba(image, value_range=None):
+    # Grayscale RGBA, pixels no ray went through are transparent
+    valid = np.isfinite(image)
+    if value_range is None:
+        value_range = (image[valid].min(), image[valid].max()) if valid.any() else (0.0, 1.0)
+    low, high = value_range
+    gray = np.clip((np.nan_to_num(image, nan=low) - low) / max(high - low, 1e-6), 0, 1)
+    gray = (gray * 255 + 0.5).astype(np.uint8)
+    return np.dstack([gray, gray, gray, np.where(valid, 255, 0).astype(np.uint8)])
@@ -0,0 +1,157 @@
+import os
+import time
+import numpy as np
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.vtkIOImage import vtkDICOMImageReader
+
+from src.pipeline import build_pipeline, DEFAULT_SIZE
+from src.export.nerf import export_to_nerf, count_schedule_poses, FrameCapture, DEFAULT_FOLDER, IMAGE_EXTENSION
+from src.export.packed import write_rgba
+from src.utils import make_or_clean_dir
+
+
+PHASE_FOLDER = 'phase_{:03d}'
+POSE_FOLDER = 'pose_az{:g}_el{:g}'
+
+
+def find_phase_folders(series_folder):
+    # One sub folder per phase, in name order; hidden folders such as the series index's
+    # .series links are not phases
+    return sorted(os.path.join(series_folder, name) for name in os.listdir(series_folder)
+                  if not name.startswith('.') and os.path.isdir(os.path.join(series_folder, name)))
+
+
+class PhaseSeries(object):
+    # Phases of a time-resolved study that share one geometry. All phases are decoded
+    # once; the pipeline renders a single vtkImageData whose scalar array is pointed at
+    # the current phase's array, so switching phases copies nothing on the CPU side and
+    # only the texture upload is paid on the next render.
+    def __init__(self, phase_folders):
+        if not phase_folders:
+            raise ValueError("A series needs at least one phase")
+        self.phase_folders = list(phase_folders)
+        self._readers = []
+        self._scalars = []
+        for folder in self.phase_folders:
+            reader = vtkDICOMImageReader()
+            reader.SetDirectoryName(folder)
+            reader.Update()
+            self._readers.append(reader)
+            self._scalars.append(reader.GetOutput().GetPointData().GetScalars())
+        first = self._readers[0].GetOutput()
+        self.dimensions = first.GetDimensions()
+        self.spacing = first.GetSpacing()
+        self.origin = first.GetOrigin()
+        for folder, reader in zip(self.phase_folders[1:], self._readers[1:]):
+            output = reader.GetOutput()
+            geometry = (output.GetDimensions(), output.GetSpacing(), output.GetOrigin())
+            if geometry[0] != self.dimensions or not np.allclose(geometry[1], self.spacing) \
+                    or not np.allclose(geometry[2], self.origin):
+                raise ValueError(f"Phase {folder} does not share the geometry of {self.phase_folders[0]}: "
+                                 f"{geometry} != {(self.dimensions, self.spacing, self.origin)}")
+        self.image = vtkImageData()
+        self.image.CopyStructure(first)
+        self.phase = -1
+        self.set_phase(0)
+
+    def __len__(self):
+        return len(self._scalars)
+
+    def set_phase(self, phase):
+        start = time.perf_counter()
+        if phase != self.phase:
+            self.image.GetPointData().SetScalars(self._scalars[phase])
+            self.image.Modified()
+            self.phase = phase
+        return time.perf_counter() - start
+
+
+def _render_phase(series, pipeline, phase):
+    # Swap cost, then the first frame after the swap, which includes the texture upload
+    swap = series.set_phase(phase)
+    start = time.perf_counter()
+    pipeline.render_window.Render()
+    return swap, time.perf_counter() - start
+
+
+def export_schedule_per_phase(series, pipeline, output_dir=DEFAULT_FOLDER, **export_options):
+    # The whole export_to_nerf pose schedule for every phase, into phase_<n>/ folders
+    frames = count_schedule_poses(**{name: export_options[name] for name in ('azimuth_step', 'elevation_step')
+                                     if name in export_options})
+    report = []
+    for phase in range(len(series)):
+        swap, first_frame = _render_phase(series, pipeline, phase)
+        pipeline.reset_camera()
+        start = time.perf_counter()
+        export_to_nerf(pipeline.camera, pipeline.render_window,
+                       output_dir=os.path.join(output_dir, PHASE_FOLDER.format(phase)),
+                       show_preview=False, **export_options)
+        report.append({"phase": phase, "swap": swap, "first_frame": first_frame,
+                       "export": time.perf_counter() - start, "frames": frames})
+    return report
+
+
+def export_pose_across_phases(series, pipeline, pose, output_dir):
+    # One camera pose rendered for every phase, e.g. for a cine loop. Only the pose's own
+    # sub folder is cleaned, like export_to_nerf cleans only its output_as*_es* folder.
+    output_dir = os.path.join(output_dir, POSE_FOLDER.format(pose.get('azimuth', 0.0), pose.get('elevation', 0.0)))
+    make_or_clean_dir(output_dir)
+    pipeline.apply_pose(pose)
+    capture = FrameCapture(pipeline.render_window)
+    report = []
+    for phase in range(len(series)):
+        swap, first_frame = _render_phase(series, pipeline, phase)
+        start = time.perf_counter()
+        path = os.path.join(output_dir, f'{PHASE_FOLDER.format(phase)}.{IMAGE_EXTENSION}')
+        write_rgba(path, capture.capture())
+        report.append({"phase": phase, "swap": swap, "first_frame": first_frame,
+                       "export": time.perf_counter() - start, "frames": 1})
+    return report
+
+
+def rebuild_baseline(phase_folders, size=DEFAULT_SIZE):
+    # What one main.py invocation per phase pays: reader, pipeline and first frame from scratch
+    timings = []
+    for folder in phase_folders:
+        start = time.perf_counter()
+        pipeline = build_pipeline(folder, size=size, offscreen=True)
+        pipeline.render_window.Render()
+        timings.append(time.perf_counter() - start)
+        pipeline.release()
+    return timings
+
+
+def print_series_report(report, load_time, total_time, baseline=None):
+    print(f"{'phase':>6} {'swap [ms]':>10} {'first frame [ms]':>17} {'export [s]':>11}")
+    for row in report:
+        print(f"{row['phase']:>6} {row['swap'] * 1e3:10.3f} {row['first_frame'] * 1e3:17.1f} {row['export']:11.3f}")
+    switch = np.mean([row['swap'] + row['first_frame'] for row in report])
+    frames = sum(row['frames'] for row in report)
+    print(f"load {load_time:.2f}s, {len(report)} phases, {frames} frames in {total_time:.2f}s "
+          f"({frames / total_time:.1f} frames/s), mean phase switch {switch * 1e3:.1f}ms")
+    if baseline:
+        rebuild = np.mean(baseline)
+        print(f"rebuild each phase: {rebuild:.2f}s per phase, "
+              f"{rebuild / switch:.0f}x the in-place switch")
+
+
+def run_series(phase_folders, size=DEFAULT_SIZE, pose=None, output_dir=DEFAULT_FOLDER, baseline=False,
+               projection_mode=None, slab_thickness=None, slab_normal=(0, 1, 0), **export_options):
+    start = time.perf_counter()
+    series = PhaseSeries(phase_folders)
+    pipeline = build_pipeline(None, size=size, offscreen=True, input_data=series.image)
+    if projection_mode is not None:
+        pipeline.set_projection_mode(projection_mode, slab_thickness, slab_normal)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if pose is None:
+        report = export_schedule_per_phase(series, pipeline, output_dir, **export_options)
+    else:
+        report = export_pose_across_phases(series, pipeline, pose, output_dir)
+    total_time = time.perf_counter() - start
+    pipeline.release()
+
+    print_series_report(report, load_time, total_time,
+                        rebuild_baseline(phase_folders, size) if baseline else None)
+    return report
@@ -0,0 +1,169 @@
+import os
+import time
+import numpy as np
+from collections import OrderedDict
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from src.pipeline import build_pipeline, DEFAULT_SIZE
+from src.export.nerf import FrameCapture, IMAGE_EXTENSION
+from src.export.packed import write_rgba
+from src.authkey import resolve_authkey, DEFAULT_KEY_FILE
+
+
+DEFAULT_ADDRESS = ('localhost', 6060)
+DEFAULT_MAX_VOLUMES = 2
+OUTPUT_ARRAY = 'array'
+OUTPUT_FILE = 'file'
+
+
+def parse_address(address):
+    # "host:port" for a local TCP socket, anything else is a unix socket / windows pipe path
+    if isinstance(address, str) and ':' in address and not address.startswith('\\\\'):
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address
+
+
+class RenderServer(object):
+    # Keeps up to max_volumes pipelines loaded (least recently used is released first),
+    # so repeated requests skip DICOM decode, texture upload and shader setup
+    def __init__(self, max_volumes=DEFAULT_MAX_VOLUMES, size=DEFAULT_SIZE, pipeline_options=None):
+        self._max_volumes = max_volumes
+        self._size = tuple(size)
+        self._pipeline_options = dict(pipeline_options or {})
+        self._pipelines = OrderedDict()
+        self._running = False
+
+    def get_pipeline(self, dicom_folder):
+        key = os.path.abspath(dicom_folder)
+        if key in self._pipelines:
+            self._pipelines.move_to_end(key)
+            return self._pipelines[key], 0.0
+        start = time.perf_counter()
+        pipeline = build_pipeline(dicom_folder, size=self._size, offscreen=True, **self._pipeline_options)
+        # First render uploads the volume texture and compiles the shaders
+        pipeline.render_window.Render()
+        self._pipelines[key] = pipeline
+        while len(self._pipelines) > self._max_volumes:
+            _, evicted = self._pipelines.popitem(last=False)
+            evicted.release()
+        return pipeline, time.perf_counter() - start
+
+    def unload(self, dicom_folder):
+        pipeline = self._pipelines.pop(os.path.abspath(dicom_folder), None)
+        if pipeline is not None:
+            pipeline.release()
+        return pipeline is not None
+
+    def render(self, volume, poses, output=OUTPUT_ARRAY, output_dir=None, prefix='r_'):
+        start = time.perf_counter()
+        pipeline, load_time = self.get_pipeline(volume)
+        capture = FrameCapture(pipeline.render_window)
+        images = []
+        render_times = []
+        if output == OUTPUT_FILE:
+            os.makedirs(output_dir, exist_ok=True)
+        else:
+            # Frames are read straight into one (N, H, W, 4) array
+            frames = np.empty((len(poses),) + capture.shape, dtype=np.uint8)
+        for idx, pose in enumerate(poses):
+            pose_start = time.perf_counter()
+            pipeline.apply_pose(pose)
+            if output == OUTPUT_FILE:
+                path = os.path.join(output_dir, f'{prefix}{idx}.{IMAGE_EXTENSION}')
+                write_rgba(path, capture.capture())
+                images.append(path)
+            else:
+                images.append(capture.capture(frames[idx]))
+            render_times.append(time.perf_counter() - pose_start)
+        return {
+            "images": images,
+            "latency": {
+                "load": load_time,
+                "render": render_times,
+                "total": time.perf_counter() - start
+            }
+        }
+
+    def status(self):
+        return {"volumes": list(self._pipelines.keys()), "max_volumes": self._max_volumes, "size": self._size}
+
+    def handle(self, request):
+        command = request.get('command')
+        try:
+            if command == 'render':
+                response = self.render(request['volume'], request['poses'],
+                                       request.get('output', OUTPUT_ARRAY),
+                                       request.get('output_dir'),
+                                       request.get('prefix', 'r_'))
+            elif command == 'load':
+                _, load_time = self.get_pipeline(request['volume'])
+                response = {"latency": {"load": load_time}}
+            elif command == 'unload':
+                response = {"unloaded": self.unload(request['volume'])}
+            elif command == 'status':
+                response = self.status()
+            elif command == 'shutdown':
+                self._running = False
+                response = {}
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        response["ok"] = True
+        return response
+
+    def serve(self, address=DEFAULT_ADDRESS, authkey=None, key_file=DEFAULT_KEY_FILE):
+        # VTK is not thread safe, connections are served one at a time
+        authkey = resolve_authkey(authkey, key_file, create=True)
+        self._running = True
+        with Listener(address, authkey=authkey) as listener:
+            print("Render server listening on", listener.address)
+            while self._running:
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    print("Rejected connection:", e)
+                    continue
+                with connection:
+                    self._serve_connection(connection)
+        for pipeline in self._pipelines.values():
+            pipeline.release()
+        self._pipelines.clear()
+
+    def _serve_connection(self, connection):
+        # A client that drops mid request only ends its own connection
+        while self._running:
+            try:
+                request = connection.recv()
+                connection.send(self.handle(request))
+            except EOFError:
+                return
+            except OSError as e:
+                print("Connection lost:", e)
+                return
+
+
+class RenderClient(object):
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, key_file=DEFAULT_KEY_FILE):
+        self._connection = Client(address, authkey=resolve_authkey(authkey, key_file))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def request(self, **request):
+        self._connection.send(request)
+        response = self._connection.recv()
+        if not response.pop("ok"):
+            raise RuntimeError(response["error"])
+        return response
+
+    def render(self, volume, poses, output=OUTPUT_ARRAY, output_dir=None):
+        return self.request(command='render', volume=volume, poses=poses, output=output, output_dir=output_dir)
+
+    def close(self):
+        self._connection.close()
@@ -1,9 +1,7 @@
 import os
 import shutil
 import numpy as np
-import json
-import pathlib
-import posixpath
+from src.model.pose_table import PoseTable
 
 def clean_dir(directory):
     if directory is None:
@@ -65,16 +63,7 @@ def convert_blender_transform_matrix(vtk_matrix, camera):
 def fix_transform_file_path(json_path, dataset_dir, keep_ext=True):
     # ./..\\output\\train/r_98.png
     # to ./train/r_98
-    with open(json_path) as file:
-        data = json.load(file)
-        for frame in data['frames']:
-            path = frame['file_path']
-            path = os.path.relpath(path, dataset_dir)
-            if not keep_ext:
-                path = os.path.splitext(path)[0]
-            path = pathlib.Path(path).as_posix()
-            path = posixpath.join('./', path)
-            frame['file_path'] = path
-
-    with open(json_path, 'w') as outfile:
-        outfile.write(json.dumps(data))
+    # Kept for existing transforms json files, the exporter rewrites paths on the PoseTable directly
+    table = PoseTable.from_json(json_path)
+    table.make_paths_relative(dataset_dir, keep_ext)
+    table.write_json(json_path)
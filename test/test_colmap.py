@@ -0,0 +1,123 @@
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.export.colmap import ColmapJob, ColmapRunner, ColmapError, write_known_model, run_command, \
+    COLMAP_EXECUTABLE_ENV
+
+# Stands in for COLMAP: logs its arguments, then exits with $STUB_COLMAP_EXIT after
+# sleeping $STUB_COLMAP_SLEEP seconds
+STUB_SCRIPT = '''#!{python}
+import os, sys, time
+with open(os.environ['STUB_COLMAP_LOG'], 'a') as log:
+    log.write(' '.join(sys.argv[1:]) + '\\n')
+print('stub colmap', sys.argv[1])
+time.sleep(float(os.environ.get('STUB_COLMAP_SLEEP', 0)))
+sys.exit(int(os.environ.get('STUB_COLMAP_EXIT', 0)))
+'''
+INTRINSICS = (800, 600, 700.0, 700.0, 400.0, 300.0)
+
+
+def view_matrix(tx, ty, tz):
+    matrix = np.eye(4)
+    matrix[:3, 3] = tx, ty, tz
+    return matrix
+
+
+@unittest.skipIf(os.name == 'nt', 'the stub COLMAP is a shebang script')
+class StubColmapTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stub = os.path.join(self.tmp, 'colmap')
+        with open(self.stub, 'w') as outfile:
+            outfile.write(STUB_SCRIPT.format(python=sys.executable))
+        os.chmod(self.stub, os.stat(self.stub).st_mode | stat.S_IEXEC)
+        self.log = os.path.join(self.tmp, 'calls.log')
+        self.environ = dict(os.environ)
+        os.environ[COLMAP_EXECUTABLE_ENV] = self.stub
+        os.environ['STUB_COLMAP_LOG'] = self.log
+        os.environ.pop('STUB_COLMAP_EXIT', None)
+        os.environ.pop('STUB_COLMAP_SLEEP', None)
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmp)
+
+    def known_poses_job(self):
+        image_path = os.path.join(self.tmp, 'images')
+        os.makedirs(image_path)
+        return ColmapJob('train', image_path, os.path.join(self.tmp, 'workspace'),
+                         image_names=['r_1.png', 'r_0.png'],
+                         view_matrices=[view_matrix(1, 0, 0), view_matrix(0, 0, -5)],
+                         intrinsics=INTRINSICS)
+
+    def calls(self):
+        with open(self.log) as file:
+            return [line.split()[0] for line in file]
+
+    def test_write_known_model(self):
+        model_path = os.path.join(self.tmp, 'known')
+        names = ['r_10.png', 'r_2.png', 'r_1.png']
+        matrices = [view_matrix(10, 0, 0), view_matrix(2, 0, 0), view_matrix(1, 2, 3)]
+        write_known_model(model_path, names, matrices, INTRINSICS)
+
+        with open(os.path.join(model_path, 'cameras.txt')) as file:
+            self.assertEqual(file.read().split(), ['1', 'PINHOLE', '800', '600', '700.0', '700.0', '400.0', '300.0'])
+        with open(os.path.join(model_path, 'images.txt')) as file:
+            lines = file.read().splitlines()
+        # One line per image followed by an empty POINTS2D line
+        self.assertEqual(lines[1::2], ['', '', ''])
+        images = [line.split() for line in lines[0::2]]
+        # Ids follow file name order, like COLMAP's feature_extractor
+        self.assertEqual([(image[0], image[-1]) for image in images],
+                         [('1', 'r_1.png'), ('2', 'r_10.png'), ('3', 'r_2.png')])
+        self.assertTrue(all(image[8] == '1' for image in images))
+        # VTK looks down -z with y up: the identity rotation becomes 180 degrees about x
+        qvec = np.array(images[0][1:5], dtype=np.float64)
+        tvec = np.array(images[0][5:8], dtype=np.float64)
+        np.testing.assert_allclose(np.abs(qvec), [0, 1, 0, 0], atol=1e-9)
+        np.testing.assert_allclose(tvec, [1, -2, -3])
+        self.assertEqual(os.path.getsize(os.path.join(model_path, 'points3D.txt')), 0)
+
+    def test_known_poses_steps(self):
+        runner = ColmapRunner()
+        self.assertEqual(runner.executable, [self.stub])
+        result = runner.reconstruct(self.known_poses_job())
+        self.assertTrue(result.ok, result.error)
+        self.assertEqual(self.calls(), ['feature_extractor', 'exhaustive_matcher', 'point_triangulator',
+                                        'model_converter'])
+
+    def test_nonzero_exit(self):
+        os.environ['STUB_COLMAP_EXIT'] = '3'
+        result = ColmapRunner().reconstruct(self.known_poses_job())
+        self.assertFalse(result.ok)
+        self.assertIsInstance(result.error, ColmapError)
+        self.assertEqual(result.error.step, 'feature_extractor')
+        self.assertEqual(result.error.returncode, 3)
+        self.assertIn('stub colmap feature_extractor', result.error.output)
+        # The failing step ends the job
+        self.assertEqual(self.calls(), ['feature_extractor'])
+
+    def test_timeout(self):
+        os.environ['STUB_COLMAP_SLEEP'] = '10'
+        with self.assertRaises(ColmapError) as context:
+            run_command('feature_extractor', [self.stub, 'feature_extractor'], timeout=0.5)
+        self.assertEqual(context.exception.step, 'feature_extractor')
+        self.assertIsNone(context.exception.returncode)
+        self.assertIn('timed out', str(context.exception))
+
+        result = ColmapRunner(timeout=0.5).reconstruct(self.known_poses_job())
+        self.assertFalse(result.ok)
+        self.assertEqual(result.error.step, 'feature_extractor')
+        self.assertIn('timed out', str(result.error))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.export.packed import PackedDatasetWriter, PackedDatasetReader, png_to_packed, packed_to_png, write_rgba, \
+    read_rgba, INDEX_FILE, COMPRESSION_RAW, COMPRESSION_ZLIB
+from src.model.pose_table import PoseTable
+
+SHAPE = (6, 5, 4)
+META = {"camera_angle_x": 0.5, "w": 5.0, "h": 6.0}
+
+
+def make_frames(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, SHAPE, dtype=np.uint8) for _ in range(count)]
+
+
+def pose(idx):
+    matrix = np.eye(4, dtype=np.float32)
+    matrix[:3, 3] = idx, -idx, 2 * idx
+    return matrix
+
+
+class PackedDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.packed_dir = os.path.join(self.tmp, 'packed')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write_dataset(self, compression, dedupe=True, frames_per_shard=2):
+        # 5 train frames, test and val repeat train frames 1 and 3 like export_to_nerf does
+        frames = make_frames(5)
+        expected = []
+        with PackedDatasetWriter(self.packed_dir, frames_per_shard, compression, dedupe) as writer:
+            for split in ('train', 'test', 'val'):
+                writer.set_split_meta(split, META)
+            for idx, frame in enumerate(frames):
+                writer.add_frame(frame, 'train', f'./train/r_{idx}.png', pose(idx), sharpness=idx / 10)
+                expected.append((frame, 'train', f'./train/r_{idx}.png', pose(idx)))
+            for split, source in (('test', 1), ('val', 3)):
+                writer.add_frame(frames[source], split, f'./{split}/r_0.png', pose(source), sharpness=source / 10)
+                expected.append((frames[source], split, f'./{split}/r_0.png', pose(source)))
+        return expected
+
+    def check_round_trip(self, compression):
+        expected = self.write_dataset(compression)
+        with PackedDatasetReader(self.packed_dir) as reader:
+            self.assertEqual(len(reader), len(expected))
+            for idx, (frame, split, path, matrix) in enumerate(expected):
+                np.testing.assert_array_equal(reader.get_image(idx), frame)
+                np.testing.assert_array_equal(reader.get_transform_matrix(idx), matrix)
+                self.assertEqual(reader.poses.paths[idx], path)
+                self.assertEqual(reader.poses.split_labels[idx], split)
+            np.testing.assert_allclose(reader.poses.column('sharpness'), [0, 0.1, 0.2, 0.3, 0.4, 0.1, 0.3], rtol=1e-6)
+            self.assertEqual(sorted(reader.splits), ['test', 'train', 'val'])
+            self.assertEqual(reader.split_meta('val'), META)
+            np.testing.assert_array_equal(reader.split_indices('train'), [0, 1, 2, 3, 4])
+            val = reader.split_poses('val')
+            self.assertEqual(list(val.paths), ['./val/r_0.png'])
+            self.assertEqual(val.meta, META)
+
+    def index(self):
+        with open(os.path.join(self.packed_dir, INDEX_FILE)) as file:
+            return json.load(file)
+
+    def test_round_trip_raw(self):
+        self.check_round_trip(COMPRESSION_RAW)
+        with PackedDatasetReader(self.packed_dir) as reader:
+            # raw frames are views into the read-only mapped shard
+            self.assertFalse(reader.get_image(0).flags.writeable)
+
+    def test_round_trip_zlib(self):
+        self.check_round_trip(COMPRESSION_ZLIB)
+        self.assertEqual(self.index()["compression"], COMPRESSION_ZLIB)
+
+    def test_dedupe_and_shard_rollover(self):
+        self.write_dataset(COMPRESSION_RAW, dedupe=True, frames_per_shard=2)
+        index = self.index()
+        # 5 unique frames, 2 per shard; the test and val frames reuse train blobs
+        self.assertEqual(index["shards"], ['shard_00000.bin', 'shard_00001.bin', 'shard_00002.bin'])
+        frames = index["frames"]
+        self.assertEqual(frames[5], frames[1])
+        self.assertEqual(frames[6], frames[3])
+        self.assertEqual([frame["shard"] for frame in frames[:5]], [0, 0, 1, 1, 2])
+        nbytes = int(np.prod(SHAPE))
+        self.assertEqual(os.path.getsize(os.path.join(self.packed_dir, 'shard_00002.bin')), nbytes)
+
+    def test_no_dedupe(self):
+        self.write_dataset(COMPRESSION_RAW, dedupe=False, frames_per_shard=2)
+        index = self.index()
+        self.assertEqual(len(index["shards"]), 4)
+        self.assertNotEqual(index["frames"][5], index["frames"][1])
+
+    def test_shared_image(self):
+        frame = make_frames(1)[0]
+        with PackedDatasetWriter(self.packed_dir) as writer:
+            image = writer.add_image(frame)
+            writer.add_pose(image, 'train', './train/r_0.png', pose(0))
+            writer.add_pose(image, 'test', './test/r_0.png', pose(0))
+        with PackedDatasetReader(self.packed_dir) as reader:
+            self.assertEqual(len(reader), 2)
+            np.testing.assert_array_equal(reader[1], frame)
+        self.assertEqual(os.path.getsize(os.path.join(self.packed_dir, 'shard_00000.bin')), frame.nbytes)
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            PackedDatasetWriter(self.packed_dir, compression='lz4')
+        with PackedDatasetWriter(self.packed_dir) as writer:
+            with self.assertRaises(ValueError):
+                writer.add_frame(np.zeros((4, 4, 3), dtype=np.uint8), 'train', './train/r_0.png', pose(0))
+
+    def test_png_round_trip(self):
+        dataset_dir = os.path.join(self.tmp, 'dataset')
+        frames = make_frames(3)
+        poses = PoseTable(meta=META)
+        for split in ('train', 'test', 'val'):
+            os.makedirs(os.path.join(dataset_dir, split))
+        for idx, frame in enumerate(frames):
+            write_rgba(os.path.join(dataset_dir, 'train', f'r_{idx}.png'), frame)
+            poses.append(pose(idx), f'./train/r_{idx}.png', 'train')
+        poses.write_transforms(dataset_dir)
+
+        png_to_packed(dataset_dir, self.packed_dir, frames_per_shard=2, compression=COMPRESSION_ZLIB)
+        unpacked_dir = os.path.join(self.tmp, 'unpacked')
+        packed_to_png(self.packed_dir, unpacked_dir)
+        for idx, frame in enumerate(frames):
+            np.testing.assert_array_equal(read_rgba(os.path.join(unpacked_dir, 'train', f'r_{idx}.png')), frame)
+        unpacked = PoseTable.from_json(os.path.join(unpacked_dir, 'transforms_train.json'))
+        np.testing.assert_array_equal(unpacked.matrices, poses.matrices)
+        self.assertEqual(list(unpacked.paths), list(poses.paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.model.pose_table import PoseTable, pose_table_path, SPLITS
+
+META = {"camera_angle_x": 0.69, "fl_x": 1100.0, "fl_y": 1100.0, "cx": 400.0, "cy": 400.0, "w": 800.0, "h": 800.0}
+# More frames than the initial capacity, so append has to grow the arrays
+FRAMES = 70
+
+
+def make_table():
+    rng = np.random.default_rng(0)
+    table = PoseTable(meta=META)
+    for idx in range(FRAMES):
+        split = SPLITS[idx % 3]
+        table.append(rng.standard_normal((4, 4)), f'./{split}/r_{idx}.png', split, sharpness=idx * 0.5)
+    return table
+
+
+class PoseTableTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def assert_tables_equal(self, table, other):
+        self.assertEqual(len(table), len(other))
+        np.testing.assert_array_equal(table.matrices, other.matrices)
+        self.assertEqual(list(table.paths), list(other.paths))
+        np.testing.assert_array_equal(table.splits, other.splits)
+        self.assertEqual(table.column_names, other.column_names)
+        for name in table.column_names:
+            np.testing.assert_array_equal(table.column(name), other.column(name))
+        self.assertEqual(table.meta, other.meta)
+
+    def test_append(self):
+        table = make_table()
+        self.assertEqual(len(table), FRAMES)
+        self.assertEqual(table.matrices.shape, (FRAMES, 4, 4))
+        self.assertEqual(table.matrices.dtype, np.float32)
+        self.assertEqual(table.split_labels[:4].tolist(), ['train', 'test', 'val', 'train'])
+        self.assertEqual(table.column('sharpness')[-1], (FRAMES - 1) * 0.5)
+
+    def test_save_load(self):
+        table = make_table()
+        path = os.path.join(self.tmp, 'poses.npz')
+        table.save(path)
+        self.assert_tables_equal(table, PoseTable.load(path))
+
+    def test_save_load_empty(self):
+        path = os.path.join(self.tmp, 'poses.npz')
+        PoseTable(meta=META).save(path)
+        loaded = PoseTable.load(path)
+        self.assertEqual(len(loaded), 0)
+        self.assertEqual(loaded.meta, META)
+
+    def test_json_round_trip(self):
+        table = make_table()
+        table.write_transforms(self.tmp)
+        for split in SPLITS:
+            json_path = os.path.join(self.tmp, f'transforms_{split}.json')
+            with open(json_path) as file:
+                data = json.load(file)
+            # transforms_*.json layout: the intrinsics, then one entry per frame
+            self.assertEqual({key: data[key] for key in META}, META)
+            self.assertEqual(list(data["frames"][0].keys()), ['file_path', 'sharpness', 'transform_matrix'])
+            loaded = PoseTable.from_json(json_path, split)
+            self.assert_tables_equal(table.select(split), loaded)
+
+    def test_select_take_concatenate(self):
+        table = make_table()
+        train = table.select('train')
+        self.assertTrue(all(path.startswith('./train/') for path in train.paths))
+        test = table.take([1, 4])
+        test.set_split('val')
+        joined = PoseTable.concatenate([train, PoseTable(), test])
+        self.assertEqual(len(joined), len(train) + 2)
+        self.assertEqual(joined.split_labels[-2:].tolist(), ['val', 'val'])
+        self.assertEqual(joined.meta, META)
+        np.testing.assert_array_equal(joined.find_paths(['./test/r_4.png', './missing.png']), [len(train) + 1, -1])
+
+    def test_make_paths_relative(self):
+        table = PoseTable(np.eye(4)[None], [os.path.join(self.tmp, 'train', 'r_0.png')])
+        table.make_paths_relative(self.tmp, keep_ext=False)
+        self.assertEqual(list(table.paths), ['./train/r_0'])
+
+    def test_pose_table_path(self):
+        self.assertEqual(pose_table_path(os.path.join('out', 'transforms_train.json')),
+                         os.path.join('out', 'transforms_train.npz'))
+
+
+if __name__ == '__main__':
+    unittest.main()